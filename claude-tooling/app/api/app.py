@@ -8,7 +8,7 @@ import logging
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import RedirectResponse
+from fastapi.responses import RedirectResponse, ORJSONResponse
 import anthropic
 from dotenv import load_dotenv
 
@@ -25,11 +25,16 @@ logger = logging.getLogger(__name__)
 # Load environment variables
 load_dotenv()
 
+# Retries for transient Claude API errors (429, 5xx, connection errors). The SDK
+# backs off exponentially with jitter and honors Retry-After.
+ANTHROPIC_MAX_RETRIES = int(os.environ.get("ANTHROPIC_MAX_RETRIES", "4"))
+
 # Initialize FastAPI app
 app = FastAPI(
     title="Claude Tooling API",
     description="API for interacting with Claude 3.7 and local tools",
-    version="0.1.0"
+    version="0.1.0",
+    default_response_class=ORJSONResponse
 )
 
 # Configure CORS
@@ -41,10 +46,17 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize Anthropic client
+# Initialize the Anthropic clients. The routers share an async client, so Claude
+# requests are awaited on the event loop without holding a worker thread. The
+# tools run in worker threads and share a synchronous one.
 try:
-    client = anthropic.Anthropic(
-        api_key=os.environ.get("ANTHROPIC_API_KEY")
+    client = anthropic.AsyncAnthropic(
+        api_key=os.environ.get("ANTHROPIC_API_KEY"),
+        max_retries=ANTHROPIC_MAX_RETRIES
+    )
+    tools_client = anthropic.Anthropic(
+        api_key=os.environ.get("ANTHROPIC_API_KEY"),
+        max_retries=ANTHROPIC_MAX_RETRIES
     )
     logger.info("Anthropic client initialized successfully")
 
@@ -55,6 +67,10 @@ try:
     # Set client for conversation router for resume endpoint
     from .routes.conversation import set_anthropic_client as set_conversation_anthropic_client
     set_conversation_anthropic_client(client)
+    
+    # Share the client with the tools, which use it to detect generated files
+    from .tools.tool_wrapper import set_anthropic_client as set_tools_anthropic_client
+    set_tools_anthropic_client(tools_client)
 
 except Exception as e:
     logger.error(f"Failed to initialize Anthropic client: {str(e)}")
@@ -2,4 +2,4 @@
 Models package for the API.
 """
 
-from .schemas import Message, ToolUse, ToolOutput, UserRequest, UserResponse 
\ No newline at end of file
+from .schemas import Message, ToolUse, ToolOutput, UserRequest, UserResponse, FileBatchRequest 
\ No newline at end of file
@@ -36,4 +36,8 @@ class UserResponse(BaseModel):
     message: Message
     conversation_id: Optional[str] = None
     tool_calls: List[Dict[str, Any]] = []
-    thinking: Optional[str] = None 
\ No newline at end of file
+    thinking: Optional[str] = None
+    
+class FileBatchRequest(BaseModel):
+    """Request model for downloading several conversation files at once."""
+    paths: List[str]
@@ -4,26 +4,23 @@ Chat API routes for interacting with Claude.
 
 import os
 import logging
-import time
 import json
+import secrets
 from typing import Dict, List, Any, Optional
-from fastapi import APIRouter, HTTPException, BackgroundTasks, Request, Depends
+from fastapi import APIRouter, HTTPException, Request, Depends
 
 from ..models.schemas import Message, UserRequest, UserResponse, ToolOutput
 from ..services.conversation import (
     conversations, conversation_root_dirs, 
     create_conversation_root_dir, add_message_to_conversation,
     get_conversation, get_root_dir, get_task_status, set_task_status,
-    reset_auto_execute_count
+    reset_auto_execute_count, build_api_messages, get_api_messages
 )
-from ..services.tool_execution import process_tool_calls_and_continue, auto_execute_tool_calls
+from ..services.tool_execution import start_tool_execution, cancel_tool_execution, auto_execute_tool_calls
+from ..services.response_service import create_message, response_to_content
 from ..tools.tool_wrapper import TOOL_DEFINITIONS, format_tool_results_for_claude
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
-)
+# Logging is configured once by the application
 logger = logging.getLogger(__name__)
 
 # Create router
@@ -43,7 +40,7 @@ def set_anthropic_client(anthropic_client):
     logger.info("Anthropic client set in chat router")
 
 @router.post("/chat", response_model=UserResponse)
-async def chat(request: UserRequest, background_tasks: BackgroundTasks, conversation_id: Optional[str] = None):
+async def chat(request: UserRequest, conversation_id: Optional[str] = None):
     """
     Process a chat request to Claude 3.7, handling tool calls.
     """
@@ -60,7 +57,7 @@ async def chat(request: UserRequest, background_tasks: BackgroundTasks, conversa
         
         # If still not found, create a new conversation_id
         if not conversation_id:
-            conversation_id = f"conv_{int(time.time())}"
+            conversation_id = "conv_" + secrets.token_urlsafe(9)
             logger.info(f"Created new conversation ID: {conversation_id}")
             
             # Create a root directory for this conversation
@@ -105,10 +102,11 @@ async def chat(request: UserRequest, background_tasks: BackgroundTasks, conversa
             temperature_param = 1.0
             logger.info("Thinking mode enabled, setting temperature to 1.0")
         
-        response = client.messages.create(
+        response = await create_message(
+            client,
             model="claude-3-7-sonnet-20250219",
             system=system_content,
-            messages=api_messages,
+            messages=build_api_messages(api_messages),
             max_tokens=request.max_tokens,
             temperature=temperature_param,
             tools=TOOL_DEFINITIONS,
@@ -116,79 +114,44 @@ async def chat(request: UserRequest, background_tasks: BackgroundTasks, conversa
         )
         
         logger.info("Received response from Claude API")
-        logger.info(f"Response type: {type(response)}")
         
         # Extract thinking if available
         thinking = None
         if hasattr(response, 'thinking'):
             thinking = response.thinking
-            logger.info(f"Found thinking: {thinking}")
+            logger.debug("Found thinking in response")
         
         # Convert response content to dictionaries
         try:
-            # First try to dump the model to a dict
-            if hasattr(response, 'model_dump'):
-                response_dict = response.model_dump()
-                logger.info(f"Successfully dumped response model")
-                raw_content = response_dict.get('content', [])
-            else:
-                # Fallback: try to access content directly
-                raw_content = response.content
-                logger.info(f"Accessed content directly: {type(raw_content)}")
-            
-            # Convert content items to dictionaries
-            content = []
-            for item in raw_content:
-                if hasattr(item, 'model_dump'):
-                    content.append(item.model_dump())
-                elif hasattr(item, '__dict__'):
-                    content.append(item.__dict__)
-                else:
-                    # If it's already a dict or compatible
-                    content.append(dict(item))
-                    
-            logger.info(f"Processed content items: {len(content)}")
+            content = response_to_content(response)
+            logger.debug("Processed content items: %d", len(content))
         except Exception as e:
             logger.error(f"Error converting response content: {str(e)}")
             raise HTTPException(status_code=500, detail=f"Error processing response: {str(e)}")
         
-        # Process tool calls
-        tool_calls = []
-        try:
-            for item in content:
-                if item.get('type') == 'tool_use':
-                    tool_calls.append({
-                        "id": item.get('id'),
-                        "name": item.get('name'),
-                        "input": item.get('input', {})
-                    })
-            
-            if tool_calls:
-                logger.info(f"Found {len(tool_calls)} tool calls")
-        except Exception as e:
-            logger.error(f"Error processing tool calls: {str(e)}")
-            
         # Update the conversation history
         if conversation_id not in conversations:
             conversations[conversation_id] = []
         
-        # Add user message and assistant response to conversation history
+        # Add user message and assistant response to conversation history; the
+        # tool calls of the response are extracted while it is indexed
         add_message_to_conversation(
             conversation_id,
             {"role": "user", "content": request.messages[-1].content}
         )
-        add_message_to_conversation(
+        tool_calls = add_message_to_conversation(
             conversation_id,
             {"role": "assistant", "content": content}
         )
+        if tool_calls:
+            logger.info(f"Found {len(tool_calls)} tool calls")
         
         # If auto-execute tools is enabled and there are tool calls, process them in the background
         if request.auto_execute_tools and tool_calls:
             logger.info("Automatic tool execution enabled, starting tool task")
             
-            # Create a background task to handle tool calls and continue conversation
-            background_tasks.add_task(
-                process_tool_calls_and_continue, 
+            # Start a task of its own to handle tool calls and continue conversation
+            task = start_tool_execution(
                 tool_calls, 
                 conversation_id, 
                 request.max_tokens, 
@@ -199,8 +162,9 @@ async def chat(request: UserRequest, background_tasks: BackgroundTasks, conversa
             )
             
             # Don't include tool calls in the response when auto-execution is enabled
-            # The frontend will get them through polling instead
-            tool_calls_for_response = []
+            # The frontend will get them through polling instead. If no task could be
+            # started, fall back to manual execution.
+            tool_calls_for_response = [] if task is not None else tool_calls
         else:
             # For manual execution, include tool calls in the response
             tool_calls_for_response = tool_calls
@@ -220,7 +184,6 @@ async def chat(request: UserRequest, background_tasks: BackgroundTasks, conversa
 @router.post("/tool-results", response_model=UserResponse)
 async def submit_tool_results(
     tool_output: ToolOutput,
-    background_tasks: BackgroundTasks,
     conversation_id: str,
     auto_execute_tools: bool = True
 ):
@@ -233,9 +196,6 @@ async def submit_tool_results(
         if conversation_id not in conversations:
             raise HTTPException(status_code=404, detail="Conversation not found")
         
-        # Get conversation history
-        history = get_conversation(conversation_id)
-        
         # Add tool output to conversation history
         add_message_to_conversation(
             conversation_id,
@@ -253,10 +213,11 @@ async def submit_tool_results(
         
         # Make the API call to continue the conversation
         logger.info("Sending tool result to Claude API")
-        response = client.messages.create(
+        response = await create_message(
+            client,
             model="claude-3-7-sonnet-20250219",
             system=system_content,
-            messages=history,
+            messages=get_api_messages(conversation_id),
             max_tokens=4096,
             temperature=1.0,  # Must be 1.0 when thinking is enabled
             tools=TOOL_DEFINITIONS,
@@ -267,65 +228,30 @@ async def submit_tool_results(
         )
         
         logger.info("Received response from Claude API")
-        logger.info(f"Response type: {type(response)}")
         
         # Convert response content to dictionaries
         try:
-            # First try to dump the model to a dict
-            if hasattr(response, 'model_dump'):
-                response_dict = response.model_dump()
-                logger.info(f"Successfully dumped response model")
-                raw_content = response_dict.get('content', [])
-            else:
-                # Fallback: try to access content directly
-                raw_content = response.content
-                logger.info(f"Accessed content directly: {type(raw_content)}")
-            
-            # Convert content items to dictionaries
-            content = []
-            for item in raw_content:
-                if hasattr(item, 'model_dump'):
-                    content.append(item.model_dump())
-                elif hasattr(item, '__dict__'):
-                    content.append(item.__dict__)
-                else:
-                    # If it's already a dict or compatible
-                    content.append(dict(item))
-                    
-            logger.info(f"Processed content items: {len(content)}")
+            content = response_to_content(response)
+            logger.debug("Processed content items: %d", len(content))
         except Exception as e:
             logger.error(f"Error converting response content: {str(e)}")
             raise HTTPException(status_code=500, detail=f"Error processing response: {str(e)}")
         
-        # Process tool calls
-        tool_calls = []
-        try:
-            for item in content:
-                if item.get('type') == 'tool_use':
-                    tool_calls.append({
-                        "id": item.get('id'),
-                        "name": item.get('name'),
-                        "input": item.get('input', {})
-                    })
-            
-            if tool_calls:
-                logger.info(f"Found {len(tool_calls)} tool calls")
-        except Exception as e:
-            logger.error(f"Error processing tool calls: {str(e)}")
-        
-        # Add assistant response to conversation history
-        add_message_to_conversation(
+        # Add assistant response to conversation history; its tool calls are
+        # extracted while it is indexed
+        tool_calls = add_message_to_conversation(
             conversation_id,
             {"role": "assistant", "content": content}
         )
+        if tool_calls:
+            logger.info(f"Found {len(tool_calls)} tool calls")
         
         # If automatic execution is enabled and there are tool calls, start background task to handle
         if auto_execute_tools and tool_calls:
             logger.info("Automatic tool execution enabled, starting tool task")
             
-            # Create a background task to handle tool calls and continue conversation
-            background_tasks.add_task(
-                process_tool_calls_and_continue, 
+            # Start a task of its own to handle tool calls and continue conversation
+            task = start_tool_execution(
                 tool_calls, 
                 conversation_id, 
                 4096,  # max_tokens 
@@ -334,12 +260,19 @@ async def submit_tool_results(
                 auto_execute_tools,
                 client
             )
+            
+            # As in chat(), tool calls that are executed automatically reach the
+            # frontend through polling. If no task could be started, fall back to
+            # manual execution.
+            tool_calls_for_response = [] if task is not None else tool_calls
+        else:
+            tool_calls_for_response = tool_calls
         
         # Prepare the response
         return UserResponse(
             message=Message(role="assistant", content=content),
             conversation_id=conversation_id,
-            tool_calls=tool_calls
+            tool_calls=tool_calls_for_response
         )
         
     except Exception as e:
@@ -354,7 +287,7 @@ async def get_tools():
     return {"tools": TOOL_DEFINITIONS}
 
 @router.post("/conversation/{conversation_id}/cancel")
-async def cancel_auto_execution(conversation_id: str):
+def cancel_auto_execution(conversation_id: str):
     """
     Cancel ongoing automatic tool execution.
     Allows user to interrupt long-running automatic tool execution process.
@@ -367,6 +300,7 @@ async def cancel_auto_execution(conversation_id: str):
         
         # Mark automatic execution task for this conversation as cancelled
         set_task_status(conversation_id, "cancelled")
+        cancel_tool_execution(conversation_id)
         
         # Add system message to conversation history
         add_message_to_conversation(
@@ -2,23 +2,23 @@
 Conversation management routes.
 """
 
+import asyncio
 import logging
-from typing import Dict, Any
-from fastapi import APIRouter, HTTPException, BackgroundTasks
+from typing import Dict, Any, Optional
+import orjson
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import ORJSONResponse, Response, StreamingResponse
 
 from ..services.conversation import (
-    conversations, get_conversation, get_root_dir,
+    conversations, get_conversation, get_root_dir, get_conversation_bundle,
+    get_conversation_state, wait_for_conversation_update,
     set_task_status, get_task_status, reset_auto_execute_count,
     add_message_to_conversation
 )
-from ..services.file_service import list_files, get_file_path, get_file_content_type
-from ..services.tool_execution import process_tool_calls_and_continue
+from ..services.file_service import list_files, iter_files, get_file_path, get_file_content_type
+from ..services.tool_execution import start_tool_execution, cancel_tool_execution
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
-)
+# Logging is configured once by the application
 logger = logging.getLogger(__name__)
 
 # Create router
@@ -27,117 +27,135 @@ router = APIRouter(prefix="/api/conversation")
 # Anthropic client - will be set from app.py
 client = None
 
+# Upper bound for how long a long-poll request may be held open (seconds)
+MAX_LONG_POLL_TIMEOUT = 60.0
+
 def set_anthropic_client(anthropic_client):
     """Set the Anthropic client for this module"""
     global client
     client = anthropic_client
     logger.info("Anthropic client set in conversation router")
 
-@router.get("/{conversation_id}/messages")
-async def get_conversation_messages(conversation_id: str):
+@router.get("/{conversation_id}/messages", response_class=ORJSONResponse)
+async def get_conversation_messages(
+    conversation_id: str,
+    wait_version: Optional[int] = None,
+    timeout: float = 25.0,
+    since: int = 0,
+    since_version: Optional[int] = None
+):
     """
     Get message history for a specific conversation.
     Used for front-end polling to get results of automatic tool execution and new assistant responses.
+    
+    When wait_version is given (the last version the client has seen), the request
+    long-polls: it is held for up to `timeout` seconds until the conversation changes.
+    When since is given (the number of messages the client already has), only the
+    messages after that index are returned; message_count is the total. Likewise,
+    since_version returns only the messages added after that version.
     """
-    logger.info(f"Getting messages for conversation {conversation_id}")
+    if wait_version is not None:
+        await wait_for_conversation_update(
+            conversation_id, wait_version, max(0.0, min(timeout, MAX_LONG_POLL_TIMEOUT))
+        )
     
-    if conversation_id not in conversations:
+    # Get state, root directory and task status in a single lookup
+    state, root_dir, task_status = get_conversation_bundle(conversation_id)
+    
+    if state is None:
         logger.warning(f"Conversation not found: {conversation_id}")
         raise HTTPException(status_code=404, detail="Conversation not found")
     
     try:
-        # Get conversation history
-        history = get_conversation(conversation_id)
-        
-        # Check conversation status from auto_execute_tasks first
-        task_status = get_task_status(conversation_id)
-        
-        if task_status == "paused":
-            # Tool execution is paused (hit the limit)
-            status = "paused"
+        if task_status in ("paused", "error", "cancelled"):
+            # Tool execution is paused (hit the limit), failed or was cancelled;
+            # the frontend stops polling on these as well as on completed
+            status = task_status
+        elif state.is_completed:
+            # Last message is an assistant reply without tool calls
+            status = "completed"
         else:
-            # Check messages to determine status
-            # Find the last message, if it's assistant message and no tool calls, then consider conversation completed
             status = "in_progress"
-            if history and len(history) > 0:
-                last_message = history[-1]
-                if last_message["role"] == "assistant":
-                    # Check if there are tool calls
-                    has_tool_call = False
-                    for item in last_message["content"]:
-                        if isinstance(item, dict) and item.get("type") == "tool_use":
-                            has_tool_call = True
-                            break
-                    
-                    if not has_tool_call:
-                        status = "completed"
-        
-        # Get the conversation root directory if available
-        root_dir = get_root_dir(conversation_id)
         
-        return {
+        # Messages are serialized once when they are added, so only the envelope
+        # is encoded here and the cached message JSON is spliced into it
+        message_json, message_count, version = state.messages_since(since, since_version)
+        envelope = orjson.dumps({
             "conversation_id": conversation_id,
-            "messages": history,
+            "message_count": message_count,
             "status": status,
-            "root_dir": root_dir
-        }
+            "root_dir": root_dir,
+            "version": version
+        })
+        body = b"".join((envelope[:-1], b',"messages":[', b",".join(message_json), b"]}"))
+        return Response(content=body, media_type="application/json")
         
     except Exception as e:
         logger.error(f"Error getting conversation messages: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/{conversation_id}/root")
-async def get_conversation_root(conversation_id: str):
+def get_conversation_root(conversation_id: str):
     """
     Get the root directory for a specific conversation.
     """
     try:
         logger.info(f"Getting root directory for conversation {conversation_id}")
         
-        if not get_root_dir(conversation_id):
-            raise HTTPException(status_code=404, detail="Conversation root directory not found")
-        
         root_dir = get_root_dir(conversation_id)
+        if not root_dir:
+            raise HTTPException(status_code=404, detail="Conversation root directory not found")
         
         return {
             "conversation_id": conversation_id,
             "root_dir": root_dir
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error getting conversation root directory: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/{conversation_id}/files")
-async def list_conversation_files(conversation_id: str):
+async def list_conversation_files(conversation_id: str, request: Request):
     """
     List files in a conversation directory
     
+    Clients that accept application/x-ndjson get one JSON object per line,
+    streamed while the directory is walked; others get {"files": [...]}.
+    
     Args:
         conversation_id: Conversation ID
+        request: The incoming request, used to pick the response format
     """
     try:
-        logger.info(f"[FILE LISTING] Request to list files for conversation: {conversation_id}")
+        logger.debug("[FILE LISTING] Request to list files for conversation: %s", conversation_id)
         
         # Check if we have a root directory for this conversation
-        if not get_root_dir(conversation_id):
+        root_dir = get_root_dir(conversation_id)
+        if not root_dir:
             logger.error(f"[FILE LISTING] Root directory not found for conversation: {conversation_id}")
             raise HTTPException(status_code=404, detail="Conversation not found")
         
-        files = list_files(conversation_id)
-        logger.info(f"[FILE LISTING] Found {len(files)} files in conversation {conversation_id}")
+        if "application/x-ndjson" in request.headers.get("accept", ""):
+            # A plain generator is iterated in Starlette's threadpool, off the event loop
+            lines = (orjson.dumps(file_info) + b"\n" for file_info in iter_files(conversation_id, root_dir))
+            return StreamingResponse(lines, media_type="application/x-ndjson")
+        
+        # Walk the directory in a worker thread to keep the event loop responsive
+        files = await asyncio.to_thread(list_files, conversation_id, root_dir)
         return {"files": files}
         
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"[FILE LISTING] Error listing files: {str(e)}")
-        import traceback
-        logger.error(f"[FILE LISTING] Traceback: {traceback.format_exc()}")
+        logger.exception(f"[FILE LISTING] Error listing files: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error listing files: {str(e)}")
         
 @router.post("/{conversation_id}/resume")
 async def resume_auto_execution(
     conversation_id: str,
-    background_tasks: BackgroundTasks,
     max_tokens: int = 4096,
     thinking_mode: bool = True,
     thinking_budget_tokens: int = 2000
@@ -156,45 +174,21 @@ async def resume_auto_execution(
         if status != "paused":
             raise HTTPException(status_code=400, detail=f"Cannot resume execution, status is {status}")
         
-        # Reset the counter and set status back to running
-        reset_auto_execute_count(conversation_id)
-        set_task_status(conversation_id, "running")
-        
-        # Add system message to conversation history
-        from ..services.conversation import add_message_to_conversation as add_msg
-        add_msg(
-            conversation_id,
-            {
-                "role": "system", 
-                "content": [{"type": "text", "text": "Automatic tool execution resumed by user"}]
-            }
-        )
-        
         # Get the tool calls from the last assistant message
-        history = get_conversation(conversation_id)
-        recent_messages = [m for m in history if m["role"] == "assistant"]
+        state = get_conversation_state(conversation_id)
         
-        if not recent_messages:
+        if state is None or state.last_assistant_index is None:
             raise HTTPException(status_code=400, detail="No assistant messages found")
         
-        last_assistant_message = recent_messages[-1]
-        content = last_assistant_message.get("content", [])
-        
-        tool_calls = []
-        for item in content:
-            if isinstance(item, dict) and item.get('type') == 'tool_use':
-                tool_calls.append({
-                    "id": item.get('id'),
-                    "name": item.get('name'),
-                    "input": item.get('input', {})
-                })
+        # Tool calls of the last assistant message are extracted when it is added
+        tool_calls = state.last_assistant_tool_calls
         
         if not tool_calls:
             raise HTTPException(status_code=400, detail="No tool calls found in last assistant message")
         
-        # Start a background task to continue processing the tool calls
-        background_tasks.add_task(
-            process_tool_calls_and_continue, 
+        # Continue processing the tool calls in a task of its own. It only starts
+        # running once this handler returns, after the state updates below.
+        task = start_tool_execution(
             tool_calls, 
             conversation_id, 
             max_tokens, 
@@ -203,15 +197,32 @@ async def resume_auto_execution(
             True,  # auto_execute_tools
             client
         )
+        if task is None:
+            raise HTTPException(status_code=503, detail="Too many tool executions in progress, try again later")
+        
+        # Reset the counter and set status back to running
+        reset_auto_execute_count(conversation_id)
+        set_task_status(conversation_id, "running")
+        
+        # Add system message to conversation history
+        add_message_to_conversation(
+            conversation_id,
+            {
+                "role": "system", 
+                "content": [{"type": "text", "text": "Automatic tool execution resumed by user"}]
+            }
+        )
         
         return {"status": "success", "message": "Automatic tool execution resumed"}
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error resuming automatic execution: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
         
 @router.post("/{conversation_id}/cancel")
-async def cancel_auto_execution(conversation_id: str):
+def cancel_auto_execution(conversation_id: str):
     """
     Cancel ongoing automatic tool execution.
     Allows user to interrupt long-running automatic tool execution process.
@@ -223,6 +234,7 @@ async def cancel_auto_execution(conversation_id: str):
             raise HTTPException(status_code=404, detail="Conversation not found")
         
         set_task_status(conversation_id, "cancelled")
+        cancel_tool_execution(conversation_id)
         
         # Add system message to conversation history
         add_message_to_conversation(
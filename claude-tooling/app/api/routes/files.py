@@ -3,86 +3,140 @@ File handling routes for conversation files.
 """
 
 import os
+import stat
+import asyncio
 import logging
-import mimetypes
-from pathlib import Path
-from fastapi import APIRouter, HTTPException
-from fastapi.responses import FileResponse
+from email.utils import formatdate
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import FileResponse, Response, StreamingResponse
 
+from ..models.schemas import FileBatchRequest
 from ..services.conversation import get_root_dir
-from ..services.file_service import get_file_path, get_file_content_type
+from ..services.file_service import resolve_file, build_zip_archive
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
-)
+# Logging is configured once by the application
 logger = logging.getLogger(__name__)
 
+# Debug headers expose server paths, so they are only sent when explicitly enabled
+DEBUG_FILE_HEADERS = os.environ.get("DEBUG_FILE_HEADERS", "").lower() in ("1", "true", "yes")
+
 # Create router
 router = APIRouter(prefix="/api/conversation")
 
 @router.get("/{conversation_id}/files/{file_path:path}")
-async def serve_conversation_file(conversation_id: str, file_path: str):
+def serve_conversation_file(conversation_id: str, file_path: str, request: Request):
     """
     Serve a file from a conversation directory
     
     Args:
         conversation_id: Conversation ID
         file_path: Path to the file within the conversation directory
+        request: The incoming request, used for conditional (If-None-Match) requests
     """
     try:
-        logger.info(f"[FILE SERVING] Request to serve file: {file_path} for conversation: {conversation_id}")
+        logger.debug("[FILE SERVING] Request to serve file: %s for conversation: %s", file_path, conversation_id)
         
         # Check if we have a root directory for this conversation
-        if not get_root_dir(conversation_id):
+        root_dir = get_root_dir(conversation_id)
+        if not root_dir:
             logger.error(f"[FILE SERVING] Root directory not found for conversation: {conversation_id}")
             raise HTTPException(status_code=404, detail="Conversation not found")
         
-        root_dir = get_root_dir(conversation_id)
-        logger.info(f"[FILE SERVING] Found root directory: {root_dir}")
-        
-        # Resolve the full file path
-        full_path = get_file_path(conversation_id, file_path)
-        logger.info(f"[FILE SERVING] Resolved full file path: {full_path}")
+        # Resolve the full file path and content type
+        full_path, content_type = resolve_file(root_dir, file_path)
+        if full_path is None:
+            logger.warning(f"[FILE SERVING] Rejected path outside conversation directory: {file_path}")
+            raise HTTPException(status_code=404, detail="File not found")
+        logger.debug("[FILE SERVING] Resolved full file path: %s (%s)", full_path, content_type)
         
-        # Check if the file exists
-        if not os.path.isfile(full_path):
+        # A single stat checks existence and provides size/mtime for the response
+        try:
+            stat_result = os.stat(full_path)
+        except OSError:
+            stat_result = None
+        if stat_result is None or not stat.S_ISREG(stat_result.st_mode):
             logger.error(f"[FILE SERVING] File not found: {full_path}")
             raise HTTPException(status_code=404, detail="File not found")
         
-        # Get file size for logging
-        file_size = os.path.getsize(full_path)
-        logger.info(f"[FILE SERVING] File size: {file_size} bytes")
-        
-        # Determine content type based on file extension
-        content_type = get_file_content_type(file_path)
-        logger.info(f"[FILE SERVING] Determined content type: {content_type}")
+        file_size = stat_result.st_size
         
-        # Add additional headers for debugging
-        headers = {
-            "X-File-Path": file_path,
-            "X-File-Size": str(file_size),
-            "X-Content-Type": content_type or "unknown",
-            "X-Debug-Full-Path": full_path,
+        # Validators let browsers revalidate with If-None-Match instead of refetching
+        cache_headers = {
+            "ETag": f'"{file_size:x}-{stat_result.st_mtime_ns:x}"',
+            "Last-Modified": formatdate(stat_result.st_mtime, usegmt=True),
         }
         
         # Ensure Cache-Control headers for proper browser caching
         if content_type and content_type.startswith('image/'):
-            headers["Cache-Control"] = "public, max-age=3600"
+            cache_headers["Cache-Control"] = "public, max-age=3600"
         
-        logger.info(f"[FILE SERVING] Serving file with headers: {headers}")
+        # Unchanged since the client's last fetch
+        if request.headers.get("if-none-match") == cache_headers["ETag"]:
+            return Response(status_code=304, headers=cache_headers)
         
-        # Return the file as a response
-        logger.info(f"[FILE SERVING] Successfully serving file: {file_path}")
+        headers = cache_headers
+        if DEBUG_FILE_HEADERS:
+            headers = {
+                **cache_headers,
+                "X-File-Path": file_path,
+                "X-File-Size": str(file_size),
+                "X-Content-Type": content_type or "unknown",
+                "X-Debug-Full-Path": full_path,
+            }
+        
+        logger.debug("[FILE SERVING] Serving file %s with headers: %s", file_path, headers)
+        
+        # Return the file as a response, reusing the stat result
         return FileResponse(
             path=full_path, 
             filename=os.path.basename(file_path),
             media_type=content_type,
-            headers=headers
+            headers=headers,
+            stat_result=stat_result
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.exception(f"[FILE SERVING] Error serving file: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error serving file: {str(e)}")
+
+@router.post("/{conversation_id}/files:batch")
+async def download_conversation_files(conversation_id: str, request: FileBatchRequest):
+    """
+    Download several files from a conversation directory as a single zip archive
+    
+    Args:
+        conversation_id: Conversation ID
+        request: The paths of the files within the conversation directory
+    """
+    try:
+        root_dir = get_root_dir(conversation_id)
+        if not root_dir:
+            raise HTTPException(status_code=404, detail="Conversation not found")
+        if not request.paths:
+            raise HTTPException(status_code=400, detail="No files requested")
+        
+        # Reading and compressing the files is blocking work, keep it off the event loop
+        try:
+            archive = await asyncio.to_thread(build_zip_archive, root_dir, request.paths)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        except FileNotFoundError as e:
+            raise HTTPException(status_code=404, detail=f"File not found: {e}")
+        
+        def iter_archive(chunk_size: int = 64 * 1024):
+            with archive:
+                while chunk := archive.read(chunk_size):
+                    yield chunk
+        
+        logger.info(f"[FILE SERVING] Serving {len(request.paths)} files as zip for conversation: {conversation_id}")
+        return StreamingResponse(
+            iter_archive(),
+            media_type="application/zip",
+            headers={"Content-Disposition": f'attachment; filename="{conversation_id}.zip"'}
         )
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"[FILE SERVING] Error serving file: {str(e)}")
-        import traceback
-        logger.error(f"[FILE SERVING] Traceback: {traceback.format_exc()}")
-        raise HTTPException(status_code=500, detail=f"Error serving file: {str(e)}") 
\ No newline at end of file
+        logger.exception(f"[FILE SERVING] Error creating zip archive: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error creating zip archive: {str(e)}")
@@ -5,7 +5,13 @@ Services package for the API.
 from .conversation import (
     conversations, conversation_root_dirs, auto_execute_tasks,
     create_conversation_root_dir, get_conversation, get_root_dir,
-    add_message_to_conversation, get_task_status, set_task_status
+    add_message_to_conversation, get_task_status, set_task_status, is_cancelled,
+    build_api_messages, get_api_messages, get_conversation_bundle, get_conversation_state,
+    ConversationState, wait_for_conversation_update
 )
-from .tool_execution import auto_execute_tool_calls, process_tool_calls_and_continue
-from .file_service import get_file_path, get_file_content_type, list_files 
\ No newline at end of file
+from .tool_execution import (
+    auto_execute_tool_calls, process_tool_calls_and_continue,
+    start_tool_execution, cancel_tool_execution
+)
+from .file_service import get_file_path, get_file_content_type, list_files, iter_files, build_zip_archive
+from .response_service import create_message, response_to_content, extract_tool_calls
@@ -3,15 +3,19 @@ Conversation management services.
 """
 
 import os
-import datetime
+import sys
+import bisect
+import time
+import asyncio
 import logging
-from typing import Dict, List, Any, Optional
+import threading
+from typing import Dict, List, Any, Optional, Tuple
+import orjson
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
-)
+from ..tools.tool_wrapper import set_conversation_root_dir
+from .response_service import extract_tool_calls
+
+# Logging is configured once by the application
 logger = logging.getLogger(__name__)
 
 # Global state for conversations
@@ -19,6 +23,124 @@ conversations = {}
 conversation_root_dirs = {}
 auto_execute_tasks = {}
 auto_execute_counts = {}  # Track the number of automatic tool executions per conversation
+conversation_states = {}  # Derived per-conversation metadata, see ConversationState
+cancel_events = {}  # Set when automatic execution of a conversation is cancelled
+
+# Parent directory of all conversation directories
+RUNS_DIR = "runs"
+_runs_dir_ready = False
+
+# Guards read-modify-write updates of the state above. Route handlers and tool
+# execution may run in worker threads, so an asyncio.Lock is not enough.
+_state_lock = threading.RLock()
+
+def _dump_message(message: Dict[str, Any]) -> bytes:
+    """Serialize a message to JSON, stringifying any value orjson cannot encode."""
+    return orjson.dumps(message, default=str)
+
+class ConversationState:
+    """
+    Metadata derived from a conversation's history.
+    
+    Kept up to date by add_message_to_conversation so that pollers can read the
+    conversation status without rescanning the history. Each message is also
+    serialized to JSON once, so polls do not re-encode the whole history, and
+    the messages Claude sees (everything but server-side system notes) are
+    mirrored in api_messages, so follow-up requests do not refilter it.
+    Long-polling readers wait on an event of their own event loop, kept in
+    `updated` by loop; the map is only created when someone waits.
+    """
+    __slots__ = (
+        "history", "message_count", "version", "last_role", "last_assistant_index",
+        "last_assistant_tool_calls", "message_json", "message_versions", "api_messages", "updated"
+    )
+    
+    def __init__(self, history: List[Dict[str, Any]], version: int = 0):
+        self.history = history
+        self.message_count = 0
+        self.version = version
+        self.last_role = None
+        self.last_assistant_index = None
+        self.last_assistant_tool_calls = []
+        self.message_json = []
+        self.message_versions = []
+        self.api_messages = []
+        self.updated = None
+        
+        if history:
+            self.message_count = len(history) - 1
+            self.message_json = [_dump_message(message) for message in history[:-1]]
+            self.message_versions = [version] * self.message_count
+            self.api_messages = [message for message in history[:-1] if message.get("role") != "system"]
+            self.last_assistant_index = next(
+                (i for i in range(len(history) - 2, -1, -1) if history[i].get("role") == "assistant"),
+                None
+            )
+            if self.last_assistant_index is not None:
+                self.last_assistant_tool_calls = extract_tool_calls(
+                    history[self.last_assistant_index].get("content") or []
+                )
+            self.observe(history[-1])
+    
+    def observe(self, message: Dict[str, Any]) -> None:
+        """
+        Update the derived fields for a message appended to the history.
+        
+        Args:
+            message: The appended message
+        """
+        self.message_count += 1
+        self.message_json.append(_dump_message(message))
+        self.last_role = message.get("role")
+        if self.last_role != "system":
+            self.api_messages.append(message)
+        if self.last_role == "assistant":
+            self.last_assistant_index = self.message_count - 1
+            self.last_assistant_tool_calls = extract_tool_calls(message.get("content") or [])
+        self.touch()
+        self.message_versions.append(self.version)
+    
+    def touch(self) -> None:
+        """Bump the version and wake up any long-polling readers."""
+        self.version += 1
+        if self.updated is not None:
+            waiters = self.updated
+            self.updated = None
+            for loop, event in waiters.items():
+                try:
+                    # May be called from a worker thread, so hand the wake-up to the waiting loop
+                    loop.call_soon_threadsafe(event.set)
+                except RuntimeError:
+                    # The waiting loop has already been closed
+                    pass
+    
+    def messages_since(self, since: int = 0, since_version: Optional[int] = None) -> Tuple[List[bytes], int, int]:
+        """
+        Get the JSON of the messages after a cursor, read consistently with the counters.
+        
+        Args:
+            since: Number of messages the reader already has
+            since_version: Last version the reader has seen; only messages added
+                after it are returned
+            
+        Returns:
+            Tuple of (message JSON list, message count, version)
+        """
+        with _state_lock:
+            if since_version is not None:
+                since = max(since, bisect.bisect_right(self.message_versions, since_version))
+            message_json = self.message_json[since:] if since > 0 else self.message_json[:]
+            return message_json, self.message_count, self.version
+    
+    @property
+    def has_pending_tool_use(self) -> bool:
+        """Whether the conversation ends with an assistant reply that has tool calls."""
+        return self.last_role == "assistant" and bool(self.last_assistant_tool_calls)
+    
+    @property
+    def is_completed(self) -> bool:
+        """Whether the conversation ends with an assistant reply that has no tool calls."""
+        return self.last_role == "assistant" and not self.has_pending_tool_use
 
 def create_conversation_root_dir(conversation_id: str) -> str:
     """
@@ -30,20 +152,30 @@ def create_conversation_root_dir(conversation_id: str) -> str:
     Returns:
         The path to the created directory
     """
-    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-    root_dir = os.path.join("runs", timestamp)
+    global _runs_dir_ready
+    
+    timestamp = time.strftime("%Y%m%d_%H%M%S")
+    root_dir = os.path.join(RUNS_DIR, timestamp)
+    
+    # The parent only needs to be created once per process
+    if not _runs_dir_ready:
+        os.makedirs(RUNS_DIR, exist_ok=True)
+        _runs_dir_ready = True
     
     # Create the directory if it doesn't exist
-    os.makedirs(root_dir, exist_ok=True)
+    try:
+        os.mkdir(root_dir)
+    except FileExistsError:
+        pass
+    except FileNotFoundError:
+        # The runs directory was removed while the process was running
+        os.makedirs(root_dir, exist_ok=True)
     
     # Store the root directory for this conversation
     conversation_root_dirs[conversation_id] = root_dir
     
     logger.info(f"Created root directory for conversation {conversation_id}: {root_dir}")
     
-    # Import here to avoid circular imports
-    from ...api.tools.tool_wrapper import set_conversation_root_dir
-    
     # Update the tool wrapper with the conversation root directory
     set_conversation_root_dir(conversation_id, root_dir)
     
@@ -61,6 +193,159 @@ def get_conversation(conversation_id: str) -> List[Dict[str, Any]]:
     """
     return conversations.get(conversation_id, [])
 
+def get_conversation_state(conversation_id: str) -> Optional[ConversationState]:
+    """
+    Get the derived state of a conversation.
+    
+    The state is rebuilt if the history was replaced or modified without going
+    through add_message_to_conversation.
+    
+    Args:
+        conversation_id: The conversation ID
+        
+    Returns:
+        The conversation state or None if the conversation does not exist
+    """
+    with _state_lock:
+        history = conversations.get(conversation_id)
+        if history is None:
+            return None
+        
+        state = conversation_states.get(conversation_id)
+        if state is None or state.history is not history or state.message_count != len(history):
+            stale_state = state
+            state = ConversationState(history, stale_state.version + 1 if stale_state else 0)
+            conversation_states[conversation_id] = state
+            if stale_state is not None:
+                # Readers waiting on the replaced state must see the change too
+                stale_state.touch()
+        
+        return state
+
+async def wait_for_conversation_update(conversation_id: str, version: int, timeout: float) -> Optional[ConversationState]:
+    """
+    Wait until a conversation moves past the given version.
+    
+    Returns immediately if the version already differs, otherwise blocks until
+    the next message or task status change, or until the timeout expires.
+    
+    Args:
+        conversation_id: The conversation ID
+        version: The version the caller has already seen
+        timeout: Maximum number of seconds to wait
+        
+    Returns:
+        The current conversation state or None if the conversation does not exist
+    """
+    with _state_lock:
+        state = get_conversation_state(conversation_id)
+        if state is None or state.version != version:
+            return state
+        
+        # asyncio events belong to one loop, so each waiting loop gets its own
+        if state.updated is None:
+            state.updated = {}
+        loop = asyncio.get_running_loop()
+        event = state.updated.get(loop)
+        if event is None:
+            event = state.updated[loop] = asyncio.Event()
+    
+    try:
+        await asyncio.wait_for(event.wait(), timeout)
+    except asyncio.TimeoutError:
+        pass
+    
+    return get_conversation_state(conversation_id)
+
+def get_conversation_bundle(conversation_id: str) -> Tuple[Optional[ConversationState], Optional[str], Optional[str]]:
+    """
+    Get the state, root directory and task status of a conversation in one call.
+    
+    Args:
+        conversation_id: The conversation ID
+        
+    Returns:
+        Tuple of (state, root_dir, task_status); state is None if the
+        conversation does not exist
+    """
+    return (
+        get_conversation_state(conversation_id),
+        conversation_root_dirs.get(conversation_id),
+        auto_execute_tasks.get(conversation_id)
+    )
+
+def _add_cache_breakpoint(api_messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Mark the last content block of API messages with an ephemeral cache_control breakpoint.
+    
+    The shared prefix is then served from Anthropic's prompt cache on the next
+    turn instead of being re-processed. Only the last message is copied, so the
+    stored history is never modified.
+    
+    Args:
+        api_messages: The messages to send, updated in place
+        
+    Returns:
+        The same list
+    """
+    if not api_messages:
+        return api_messages
+    
+    last_message = api_messages[-1]
+    content = last_message.get("content")
+    if not isinstance(content, list) or not content:
+        return api_messages
+    
+    last_block = content[-1]
+    # Thinking blocks cannot carry cache_control
+    if not isinstance(last_block, dict) or last_block.get("type") in ("thinking", "redacted_thinking"):
+        return api_messages
+    
+    api_messages[-1] = {
+        **last_message,
+        "content": content[:-1] + [{**last_block, "cache_control": {"type": "ephemeral"}}]
+    }
+    return api_messages
+
+def build_api_messages(history: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Build the message list sent to Claude from a conversation history.
+    
+    System notes that the server adds to the history (errors, cancellation,
+    limit and resume notices) are for the user only and are dropped, since the
+    Messages API only accepts user and assistant turns; without them, tool
+    results directly follow the assistant message with their tool_use blocks
+    again. This is a single pass over the history.
+    
+    Args:
+        history: The conversation history
+        
+    Returns:
+        The messages to pass to client.messages.create
+    """
+    return _add_cache_breakpoint([message for message in history if message.get("role") != "system"])
+
+def get_api_messages(conversation_id: str) -> List[Dict[str, Any]]:
+    """
+    Get the message list sent to Claude for a stored conversation.
+    
+    Same result as build_api_messages(get_conversation(conversation_id)), but
+    taken from the filtered list kept by the conversation state, so each turn
+    only copies references instead of rescanning the history.
+    
+    Args:
+        conversation_id: The conversation ID
+        
+    Returns:
+        The messages to pass to client.messages.create
+    """
+    with _state_lock:
+        state = get_conversation_state(conversation_id)
+        if state is None:
+            return []
+        api_messages = state.api_messages[:]
+    return _add_cache_breakpoint(api_messages)
+
 def get_root_dir(conversation_id: str) -> Optional[str]:
     """
     Get the root directory for a conversation.
@@ -73,18 +358,56 @@ def get_root_dir(conversation_id: str) -> Optional[str]:
     """
     return conversation_root_dirs.get(conversation_id)
 
-def add_message_to_conversation(conversation_id: str, message: Dict[str, Any]) -> None:
+def _intern_message_strings(message: Dict[str, Any]) -> None:
+    """
+    Intern the role, block type and tool name strings of a message in place.
+    
+    These few values repeat in every message; strings decoded from API
+    responses are otherwise separate objects, one per message.
+    
+    Args:
+        message: The message to update
+    """
+    role = message.get("role")
+    if isinstance(role, str):
+        message["role"] = sys.intern(role)
+    
+    content = message.get("content")
+    if not isinstance(content, list):
+        return
+    
+    for item in content:
+        if not isinstance(item, dict):
+            continue
+        item_type = item.get("type")
+        if isinstance(item_type, str):
+            item["type"] = sys.intern(item_type)
+        name = item.get("name")
+        if isinstance(name, str):
+            item["name"] = sys.intern(name)
+
+def add_message_to_conversation(conversation_id: str, message: Dict[str, Any]) -> List[Dict[str, Any]]:
     """
     Add a message to a conversation.
     
     Args:
         conversation_id: The conversation ID
         message: The message to add
+        
+    Returns:
+        The tool calls of the message if it is an assistant message, extracted
+        once while indexing it, otherwise an empty list
     """
-    if conversation_id not in conversations:
-        conversations[conversation_id] = []
+    _intern_message_strings(message)
     
-    conversations[conversation_id].append(message)
+    with _state_lock:
+        if conversation_id not in conversations:
+            conversations[conversation_id] = []
+        
+        state = get_conversation_state(conversation_id)
+        state.history.append(message)
+        state.observe(message)
+        return state.last_assistant_tool_calls if state.last_role == "assistant" else []
 
 def get_task_status(conversation_id: str) -> str:
     """
@@ -106,7 +429,33 @@ def set_task_status(conversation_id: str, status: str) -> None:
         conversation_id: The conversation ID
         status: The task status
     """
-    auto_execute_tasks[conversation_id] = status
+    with _state_lock:
+        auto_execute_tasks[conversation_id] = status
+        
+        # Cancellation is signalled through an event so running tool loops, including
+        # code in worker threads, see it without going through the status string
+        if status == "cancelled":
+            cancel_events.setdefault(conversation_id, threading.Event()).set()
+        elif conversation_id in cancel_events:
+            cancel_events[conversation_id].clear()
+        
+        # Status changes are visible to pollers, so wake them up
+        state = conversation_states.get(conversation_id)
+        if state is not None:
+            state.touch()
+    
+def is_cancelled(conversation_id: str) -> bool:
+    """
+    Check whether automatic tool execution has been cancelled for a conversation.
+    
+    Args:
+        conversation_id: The conversation ID
+        
+    Returns:
+        True if the conversation's cancel event is set
+    """
+    event = cancel_events.get(conversation_id)
+    return event is not None and event.is_set()
     
 def get_auto_execute_count(conversation_id: str) -> int:
     """
@@ -130,11 +479,10 @@ def increment_auto_execute_count(conversation_id: str) -> int:
     Returns:
         The new count
     """
-    if conversation_id not in auto_execute_counts:
-        auto_execute_counts[conversation_id] = 0
-    
-    auto_execute_counts[conversation_id] += 1
-    return auto_execute_counts[conversation_id]
+    with _state_lock:
+        count = auto_execute_counts.get(conversation_id, 0) + 1
+        auto_execute_counts[conversation_id] = count
+    return count
 
 def reset_auto_execute_count(conversation_id: str) -> None:
     """
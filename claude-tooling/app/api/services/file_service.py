@@ -3,21 +3,125 @@ File handling services for conversations.
 """
 
 import os
+import stat
 import logging
 import mimetypes
+import tempfile
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from itertools import islice
 from pathlib import Path
-from typing import Dict, List, Any
+from types import MappingProxyType
+from typing import Dict, List, Any, Optional, NamedTuple, Iterator, Tuple
 
 from ..services.conversation import get_root_dir
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
-)
+# Logging is configured once by the application
 logger = logging.getLogger(__name__)
 
-def get_file_path(conversation_id: str, file_path: str) -> str:
+# Listings with at least this many files are stat-ed in parallel
+PARALLEL_STAT_THRESHOLD = 32
+PARALLEL_STAT_WORKERS = 16
+
+_stat_executor = ThreadPoolExecutor(max_workers=PARALLEL_STAT_WORKERS, thread_name_prefix="file-stat")
+
+# Number of directory entries stat-ed at a time while listing files
+LIST_FILES_BATCH_SIZE = 256
+
+# Load the mimetypes database once at import
+mimetypes.init()
+
+# Explicit content types for the file types conversations usually produce, so they
+# render consistently across platforms whatever the system mimetypes say
+_CONTENT_TYPE_OVERRIDES = {
+    ".md": "text/markdown",
+    ".markdown": "text/markdown",
+    ".txt": "text/plain",
+    ".log": "text/plain",
+    ".py": "text/x-python",
+    ".csv": "text/csv",
+    ".tsv": "text/tab-separated-values",
+    ".html": "text/html",
+    ".htm": "text/html",
+    ".css": "text/css",
+    ".js": "text/javascript",
+    ".xml": "application/xml",
+    ".json": "application/json",
+    ".yaml": "application/yaml",
+    ".yml": "application/yaml",
+    ".pdf": "application/pdf",
+    ".zip": "application/zip",
+    ".png": "image/png",
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+    ".gif": "image/gif",
+    ".svg": "image/svg+xml",
+    ".webp": "image/webp",
+    ".bmp": "image/bmp",
+    ".ico": "image/vnd.microsoft.icon",
+    ".mp3": "audio/mpeg",
+    ".wav": "audio/wav",
+    ".mp4": "video/mp4",
+}
+
+# Extension to content type map, built once so each lookup is a single dict hit
+_EXT_TO_MIME = MappingProxyType({
+    **{ext.lower(): content_type for ext, content_type in mimetypes.types_map.items()},
+    **_CONTENT_TYPE_OVERRIDES,
+})
+
+def _file_type_category(content_type: Optional[str]) -> str:
+    """Map a content type to the coarse file type category used by the frontend."""
+    if content_type:
+        if content_type.startswith('image/'):
+            return "image"
+        if content_type.startswith('text/'):
+            return "text"
+        if content_type.startswith('application/'):
+            return "application"
+    return "other"
+
+# Content type and category per extension, so listing a file needs a single lookup
+_UNKNOWN_FILE_TYPES = (None, _file_type_category(None))
+_EXT_TO_FILE_TYPES = MappingProxyType({
+    ext: (content_type, _file_type_category(content_type))
+    for ext, content_type in _EXT_TO_MIME.items()
+})
+
+@lru_cache(maxsize=256)
+def get_root_path(root_dir: str) -> Path:
+    """
+    Get the resolved path of a conversation root directory.
+    
+    Cached so that each file request only joins and resolves the file part.
+    
+    Args:
+        root_dir: The conversation root directory
+        
+    Returns:
+        The absolute, resolved root directory
+    """
+    return Path(root_dir).resolve()
+
+def resolve_safe_path(root_dir: str, file_path: str) -> Optional[str]:
+    """
+    Resolve a file path and make sure it stays inside the conversation directory.
+    
+    Args:
+        root_dir: The conversation root directory
+        file_path: Path to the file within the conversation directory
+        
+    Returns:
+        The resolved full path, or None if it points outside root_dir
+    """
+    root_path = get_root_path(root_dir)
+    full_path = (root_path / file_path).resolve()
+    if not full_path.is_relative_to(root_path):
+        return None
+    return str(full_path)
+
+def get_file_path(conversation_id: str, file_path: str) -> Optional[str]:
     """
     Get the full path to a file in a conversation directory.
     
@@ -26,14 +130,101 @@ def get_file_path(conversation_id: str, file_path: str) -> str:
         file_path: Path to the file within the conversation directory
         
     Returns:
-        The full path to the file
+        The full path to the file, or None if the conversation is unknown or
+        the path points outside its directory
     """
     root_dir = get_root_dir(conversation_id)
     if not root_dir:
         logger.error(f"Root directory not found for conversation: {conversation_id}")
         return None
     
-    return os.path.join(root_dir, file_path)
+    full_path = resolve_safe_path(root_dir, file_path)
+    if full_path is None:
+        logger.warning(f"Rejected path outside conversation directory: {file_path}")
+    return full_path
+
+class ResolvedFile(NamedTuple):
+    """Location and content type of a file inside a conversation directory."""
+    full_path: Optional[str]
+    content_type: Optional[str]
+
+@lru_cache(maxsize=1024)
+def _served_content_type(file_path: str) -> Optional[str]:
+    """Content type of a served file; it only depends on the path, so it is cached."""
+    return get_file_content_type(file_path)
+
+def resolve_file(root_dir: str, file_path: str) -> ResolvedFile:
+    """
+    Resolve a conversation file to its full path and content type.
+    
+    Only the content type depends on the arguments alone and is cached. The
+    path depends on the filesystem, since a file may be replaced by a symlink
+    pointing outside the conversation directory at any time, so it is resolved
+    and checked against root_dir on every call.
+    
+    Args:
+        root_dir: The conversation root directory
+        file_path: Path to the file within the conversation directory
+        
+    Returns:
+        The resolved file information; full_path is None if the path points
+        outside root_dir
+    """
+    return ResolvedFile(resolve_safe_path(root_dir, file_path), _served_content_type(file_path))
+
+def build_zip_archive(root_dir: str, file_paths: List[str]) -> tempfile.SpooledTemporaryFile:
+    """
+    Write the requested conversation files into a zip archive.
+    
+    The archive is spooled in memory and only moves to disk once it grows
+    large. Files are added one at a time, so a single file descriptor is
+    open at any point regardless of the number of requested paths.
+    
+    Args:
+        root_dir: The conversation root directory
+        file_paths: Paths of the files within the conversation directory
+        
+    Returns:
+        The archive, positioned at its start
+        
+    Raises:
+        ValueError: If a path points outside the conversation directory
+        FileNotFoundError: If a path is not an existing file
+    """
+    resolved = []
+    for file_path in file_paths:
+        full_path = resolve_safe_path(root_dir, file_path)
+        if full_path is None:
+            raise ValueError(f"Invalid file path: {file_path}")
+        if not os.path.isfile(full_path):
+            raise FileNotFoundError(file_path)
+        resolved.append((full_path, file_path))
+    
+    archive = tempfile.SpooledTemporaryFile(max_size=16 * 1024 * 1024)
+    with zipfile.ZipFile(archive, mode="w", compression=zipfile.ZIP_DEFLATED) as zip_file:
+        for full_path, file_path in resolved:
+            zip_file.write(full_path, arcname=os.path.normpath(file_path))
+    archive.seek(0)
+    return archive
+
+def _file_extension(file_path: str) -> str:
+    """
+    Get the lowercase extension of a file path, including the leading dot.
+    
+    A cheaper stand-in for os.path.splitext(file_path)[1].lower(); a dot that
+    starts the file name (hidden files) or belongs to a directory is not an
+    extension.
+    
+    Args:
+        file_path: File name or path
+        
+    Returns:
+        The extension, or an empty string if there is none
+    """
+    dot = file_path.rfind('.')
+    if dot <= file_path.rfind('/') + 1 or dot <= file_path.rfind(os.sep) + 1:
+        return ''
+    return file_path[dot:].lower()
 
 def get_file_content_type(file_path: str) -> str:
     """
@@ -45,76 +236,155 @@ def get_file_content_type(file_path: str) -> str:
     Returns:
         The content type for the file
     """
-    file_extension = os.path.splitext(file_path)[1].lower()
-    content_type, _ = mimetypes.guess_type(file_path)
-    
-    # Use explicit content types for common file types to ensure proper handling
-    if file_extension == '.md':
-        content_type = 'text/markdown'
-    elif file_extension == '.png':
-        content_type = 'image/png'
-    elif file_extension in ['.jpg', '.jpeg']:
-        content_type = 'image/jpeg'
-    elif file_extension == '.html':
-        content_type = 'text/html'
-    
-    return content_type
+    return get_extension_content_type(_file_extension(file_path))
 
-def list_files(conversation_id: str) -> List[Dict[str, Any]]:
+def get_extension_content_type(file_extension: str) -> Optional[str]:
     """
-    List all files in a conversation directory.
+    Determine the content type for a file extension.
     
     Args:
-        conversation_id: The conversation ID
+        file_extension: The extension including the leading dot, e.g. ".png"
         
     Returns:
-        List of file information dictionaries
+        The content type, or None if the extension is unknown
     """
-    root_dir = get_root_dir(conversation_id)
-    if not root_dir:
-        logger.error(f"Root directory not found for conversation: {conversation_id}")
-        return []
+    return _EXT_TO_MIME.get(file_extension.lower())
+
+def _scan_files(root_dir: str) -> Iterator[Tuple[os.DirEntry, str]]:
+    """
+    Walk a directory tree with os.scandir, yielding visible non-directory entries.
     
-    files = []
-    for dirpath, dirnames, filenames in os.walk(root_dir):
-        for filename in filenames:
-            # Skip temporary or hidden files
-            if filename.startswith('.') or filename.endswith('.tmp'):
-                continue
+    DirEntry caches the type and stat information, so no extra isdir/getsize
+    syscalls are needed per entry. Hidden entries and temporary files are
+    skipped, and only real, visible directories are descended into.
+    
+    Args:
+        root_dir: The directory to walk
+        
+    Yields:
+        Tuples of (entry, path relative to root_dir)
+    """
+    # Every entry path starts with the root directory, so relative paths are a slice
+    prefix_len = len(os.path.join(root_dir, ""))
+    pending_dirs = [root_dir]
+    while pending_dirs:
+        dir_path = pending_dirs.pop()
+        try:
+            with os.scandir(dir_path) as entries:
+                dir_entries = list(entries)
+        except OSError as e:
+            logger.warning(f"Cannot list directory {dir_path}: {str(e)}")
+            continue
+        
+        for entry in dir_entries:
+            filename = entry.name
             
-            full_path = os.path.join(dirpath, filename)
-            rel_path = os.path.relpath(full_path, root_dir)
+            # Skip hidden entries (including hidden directories) before any
+            # other work; names are never empty, so a single-char test suffices
+            if filename[0] == '.':
+                continue
             
-            # Determine the file type based on extension
-            file_extension = os.path.splitext(filename)[1].lower()
-            content_type = get_file_content_type(filename)
+            if entry.is_dir(follow_symlinks=False):
+                pending_dirs.append(entry.path)
+                continue
             
-            # Get file size
-            file_size = os.path.getsize(full_path)
+            # Skip temporary files
+            if filename.endswith('.tmp'):
+                continue
             
-            # Determine file type category
-            file_type = "other"
-            if content_type:
-                if content_type.startswith('image/'):
-                    file_type = "image"
-                elif content_type.startswith('text/'):
-                    file_type = "text"
-                elif content_type.startswith('application/'):
-                    file_type = "application"
+            yield entry, entry.path[prefix_len:]
+
+def _stat_entry(entry: os.DirEntry) -> Optional[os.stat_result]:
+    """Stat a directory entry, following symlinks; None if that fails."""
+    try:
+        return entry.stat()
+    except OSError:
+        return None
+
+def _stat_entries(entries: List[os.DirEntry]) -> List[Optional[os.stat_result]]:
+    """
+    Stat directory entries, overlapping the syscalls for large listings.
+    
+    On a cold cache or network storage each stat waits on I/O, so larger
+    listings are spread over a shared thread pool to keep several stats in flight.
+    
+    Args:
+        entries: The entries to stat
+        
+    Returns:
+        The stat results in the same order, None for entries that failed
+    """
+    if len(entries) < PARALLEL_STAT_THRESHOLD:
+        return [_stat_entry(entry) for entry in entries]
+    
+    return list(_stat_executor.map(_stat_entry, entries))
+
+def iter_files(conversation_id: str, root_dir: str) -> Iterator[Dict[str, Any]]:
+    """
+    Yield information about each file in a conversation directory as the walk progresses.
+    
+    Entries are stat-ed in batches, so large listings still get parallel stats
+    while the first results are available before the whole tree is walked.
+    
+    Args:
+        conversation_id: The conversation ID
+        root_dir: The conversation root directory
+        
+    Yields:
+        File information dictionaries
+    """
+    url_prefix = f"/api/conversation/{conversation_id}/files/"
+    # Bind the per-file lookups once for the whole listing
+    file_types = _EXT_TO_FILE_TYPES.get
+    is_regular = stat.S_ISREG
+    
+    entries = _scan_files(root_dir)
+    while True:
+        batch = list(islice(entries, LIST_FILES_BATCH_SIZE))
+        if not batch:
+            return
+        
+        stat_results = _stat_entries([entry for entry, _ in batch])
+        for (entry, rel_path), stat_result in zip(batch, stat_results):
+            # Broken symlink, file removed while listing, or not a regular file
+            if stat_result is None or not is_regular(stat_result.st_mode):
+                continue
             
-            # Create file URL
-            file_url = f"/api/conversation/{conversation_id}/files/{rel_path}"
+            filename = entry.name
+            file_size = stat_result.st_size
             
-            logger.info(f"Found file: {rel_path}, type: {file_type}, size: {file_size} bytes, content-type: {content_type}")
+            # Determine the content type and file type category from the extension
+            file_extension = _file_extension(filename)
+            content_type, file_type = file_types(file_extension, _UNKNOWN_FILE_TYPES)
             
-            files.append({
+            yield {
                 "name": filename,
                 "path": rel_path,
-                "url": file_url,
+                "url": url_prefix + rel_path,
                 "size": file_size,
                 "content_type": content_type,
                 "type": file_type,
                 "extension": file_extension,
-            })
+            }
+
+def list_files(conversation_id: str, root_dir: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    List all files in a conversation directory.
+    
+    Args:
+        conversation_id: The conversation ID
+        root_dir: The conversation root directory, if already known by the caller
+        
+    Returns:
+        List of file information dictionaries
+    """
+    if root_dir is None:
+        root_dir = get_root_dir(conversation_id)
+    if not root_dir:
+        logger.error(f"Root directory not found for conversation: {conversation_id}")
+        return []
+    
+    files = list(iter_files(conversation_id, root_dir))
     
-    return files 
\ No newline at end of file
+    logger.info(f"Found {len(files)} files for conversation {conversation_id}")
+    return files
@@ -0,0 +1,150 @@
+"""
+Helpers for converting Claude API responses into plain conversation data.
+"""
+
+import os
+import asyncio
+import hashlib
+import inspect
+import logging
+from collections import OrderedDict
+from typing import Dict, List, Any, Optional
+import orjson
+from pydantic import BaseModel
+
+logger = logging.getLogger(__name__)
+
+# Number of Claude responses kept for identical requests; 0 disables the cache.
+# Meant for development and replaying conversations, so it is off by default.
+RESPONSE_CACHE_SIZE = int(os.environ.get("CLAUDE_RESPONSE_CACHE_SIZE", "0") or 0)
+
+# Serialized response content by request key, least recently used first
+_response_cache: "OrderedDict[str, bytes]" = OrderedDict()
+
+async def create_message(client: Any, **request: Any) -> Any:
+    """
+    Send a request to Claude without blocking the event loop.
+    
+    An async client (anthropic.AsyncAnthropic) is awaited directly. A
+    synchronous client is run in a worker thread instead.
+    
+    Args:
+        client: Anthropic client instance
+        **request: Arguments for client.messages.create
+        
+    Returns:
+        The API response
+    """
+    create = client.messages.create
+    # The SDK wraps its methods, so look at the function underneath
+    if inspect.iscoroutinefunction(inspect.unwrap(create)):
+        return await create(**request)
+    return await asyncio.to_thread(create, **request)
+
+def response_to_content(response: Any) -> List[Dict[str, Any]]:
+    """
+    Convert the content of a Claude API response into a list of dictionaries.
+
+    SDK responses are pydantic models, so the content is dumped in one
+    model_dump call limited to the content field, which serializes every
+    block in a single pass instead of dispatching per block, and skips the
+    rest of the message (usage, metadata, etc.). Other response objects are
+    converted block by block, and ones without a content list fall back to
+    model_dump().
+
+    Args:
+        response: The response returned by client.messages.create
+
+    Returns:
+        List of content blocks as dictionaries
+    """
+    if isinstance(response, BaseModel):
+        return response.model_dump(include={'content'}).get('content', [])
+
+    raw_content = getattr(response, 'content', None)
+    if not isinstance(raw_content, list):
+        raw_content = response.model_dump().get('content', [])
+
+    content = []
+    for item in raw_content:
+        if isinstance(item, dict):
+            # Already a dict (e.g. from model_dump), no need to copy it
+            content.append(item)
+        elif hasattr(item, 'model_dump'):
+            content.append(item.model_dump())
+        elif hasattr(item, '__dict__'):
+            content.append(item.__dict__)
+        else:
+            content.append(dict(item))
+
+    return content
+
+def extract_tool_calls(content: List[Any]) -> List[Dict[str, Any]]:
+    """
+    Extract the tool calls from a list of content blocks.
+
+    Args:
+        content: Content blocks of an assistant message
+
+    Returns:
+        List of tool calls with id, name and input
+    """
+    return [
+        {
+            "id": item.get('id'),
+            "name": item.get('name'),
+            "input": item.get('input', {})
+        }
+        for item in content
+        if isinstance(item, dict) and item.get('type') == 'tool_use'
+    ]
+
+
+def response_cache_key(**request: Any) -> Optional[str]:
+    """
+    Compute the cache key for a Claude API request.
+
+    Args:
+        **request: The keyword arguments passed to client.messages.create
+
+    Returns:
+        A hex digest of the canonical request, or None if caching is disabled
+    """
+    if RESPONSE_CACHE_SIZE <= 0:
+        return None
+    canonical = orjson.dumps(request, option=orjson.OPT_SORT_KEYS, default=str)
+    return hashlib.blake2b(canonical, digest_size=20).hexdigest()
+
+def get_cached_response(key: Optional[str]) -> Optional[List[Dict[str, Any]]]:
+    """
+    Look up the content of a cached Claude response.
+
+    Args:
+        key: The key from response_cache_key
+
+    Returns:
+        A fresh copy of the cached content blocks, or None on a miss
+    """
+    if key is None:
+        return None
+    cached = _response_cache.get(key)
+    if cached is None:
+        return None
+    _response_cache.move_to_end(key)
+    logger.info(f"Using cached Claude response {key[:12]}")
+    return orjson.loads(cached)
+
+def cache_response(key: Optional[str], content: List[Dict[str, Any]]) -> None:
+    """
+    Store the content of a Claude response, evicting the least recently used one when full.
+
+    Args:
+        key: The key from response_cache_key
+        content: Content blocks of the response
+    """
+    if key is None:
+        return
+    _response_cache[key] = orjson.dumps(content, default=str)
+    _response_cache.move_to_end(key)
+    while len(_response_cache) > RESPONSE_CACHE_SIZE:
+        _response_cache.popitem(last=False)
@@ -2,30 +2,59 @@
 Tool execution services for handling automatic tool calls.
 """
 
-import json
 import logging
 import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, List, Any, Optional
 import anthropic
+import orjson
 
 from ..services.conversation import (
     conversations, auto_execute_tasks, 
-    add_message_to_conversation, set_task_status,
+    add_message_to_conversation, get_task_status, set_task_status, is_cancelled, get_api_messages,
     get_auto_execute_count, increment_auto_execute_count, reset_auto_execute_count
 )
+from ..services.response_service import (
+    create_message, response_to_content,
+    response_cache_key, get_cached_response, cache_response
+)
 from app.api.tools.tool_wrapper import (
     process_tool_calls,
     format_tool_results_for_claude,
-    TOOL_DEFINITIONS
+    TOOL_DEFINITIONS,
+    TOOL_DEFINITIONS_HASH
 )
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
-)
+# Logging is configured once by the application
 logger = logging.getLogger(__name__)
 
+# System prompt for continuing a conversation after tool calls. Kept constant so
+# every request sends byte-identical text, which keeps the prompt cache prefix stable.
+SYSTEM_PROMPT = (
+    "You are running in a headless environment. When generating code that creates visualizations or outputs:\n"
+    "1. DO NOT use interactive elements like plt.show(), figure.show(), or display()\n"
+    "2. Instead, save outputs to files (e.g., plt.savefig('output.png'))\n"
+    "3. For Python plots, use matplotlib's savefig() method\n"
+    "4. For Jupyter-style outputs, write to files instead\n"
+    "5. Always provide complete, self-contained code that can run without user interaction\n"
+    "6. Assume your code runs in a script context, not an interactive notebook"
+)
+
+_THINKING_ENABLED = {"type": "enabled"}
+
+# Upper bound on concurrently running tool execution chains
+MAX_ACTIVE_TOOL_TASKS = 16
+
+# Tool batches get threads of their own: commands may run for minutes, and
+# must not tie up the default executor behind asyncio.to_thread, which file
+# listings and synchronous Claude clients rely on. Each chain runs one batch at a
+# time, but a batch keeps its thread until it finishes even when its chain has
+# been cancelled, so new batches may queue behind such leftovers.
+_tool_batch_executor = ThreadPoolExecutor(max_workers=MAX_ACTIVE_TOOL_TASKS, thread_name_prefix="tool-batch")
+
+# Running tool execution chains per conversation, each with the loop it runs on
+active_tool_tasks: Dict[str, Dict[asyncio.Task, asyncio.AbstractEventLoop]] = {}
+
 async def auto_execute_tool_calls(tool_calls: List[Dict[str, Any]], conversation_id: str = None) -> List[Dict[str, Any]]:
     """
     Automatically execute tool calls and return results.
@@ -38,29 +67,29 @@ async def auto_execute_tool_calls(tool_calls: List[Dict[str, Any]], conversation
         List of tool results
     """
     try:
-        logger.info(f"Automatically executing {len(tool_calls)} tool calls")
+        logger.info("Automatically executing %s tool calls", len(tool_calls))
         
-        # Use the existing process_tool_calls function to handle tool calls
-        # Since process_tool_calls may not be an async function, ensure proper handling
-        tool_results = process_tool_calls(tool_calls, conversation_id)
+        # process_tool_calls runs commands, file and web I/O synchronously, so
+        # run it on the tool executor to keep the event loop responsive
+        tool_results = await asyncio.get_running_loop().run_in_executor(
+            _tool_batch_executor, process_tool_calls, tool_calls, conversation_id
+        )
         
         # Return formatted tool results
-        logger.info(f"Tool execution completed, {len(tool_results)} results obtained")
+        logger.info("Tool execution completed, %s results obtained", len(tool_results))
         return tool_results
     
     except Exception as e:
-        logger.error(f"Error executing tool calls: {str(e)}")
-        # Return error results
-        error_results = []
-        for tool_call in tool_calls:
-            error_results.append({
-                "tool_use_id": tool_call.get("id"),
-                "content": json.dumps({
-                    "status": "error",
-                    "message": f"Error executing tool calls: {str(e)}"
-                }, ensure_ascii=False)
-            })
-        return error_results
+        logger.error("Error executing tool calls: %s", e)
+        # Return error results; every call gets the same payload, so encode it once
+        error_content = orjson.dumps({
+            "status": "error",
+            "message": f"Error executing tool calls: {str(e)}"
+        }).decode()
+        return [
+            {"tool_use_id": tool_call.get("id"), "content": error_content}
+            for tool_call in tool_calls
+        ]
 
 async def process_tool_calls_and_continue(
     tool_calls: List[Dict[str, Any]], 
@@ -69,7 +98,7 @@ async def process_tool_calls_and_continue(
     thinking_mode: bool, 
     thinking_budget_tokens: int,
     auto_execute_tools: bool,
-    client: anthropic.Anthropic
+    client: anthropic.AsyncAnthropic
 ):
     """
     Process tool calls, get results, and continue conversation with Claude until all tool calls are completed.
@@ -90,187 +119,173 @@ async def process_tool_calls_and_continue(
             
         # Get conversation history
         if conversation_id not in conversations:
-            logger.error(f"Conversation ID not found: {conversation_id}")
+            logger.error("Conversation ID not found: %s", conversation_id)
             return
         
         # Initialize or check task status
         if conversation_id not in auto_execute_tasks:
             set_task_status(conversation_id, "running")
         
-        # Check if cancelled
-        if auto_execute_tasks.get(conversation_id) == "cancelled":
-            logger.info(f"Automatic execution of conversation {conversation_id} cancelled")
-            return
-            
-        history = conversations[conversation_id]
-        
-        # Automatically execute tool calls and get results
-        try:
-            tool_results = await auto_execute_tool_calls(tool_calls, conversation_id)
-        except Exception as e:
-            logger.error(f"Error executing tool calls: {str(e)}")
-            # Add error message to history
-            add_message_to_conversation(
-                conversation_id,
-                {
-                    "role": "system",
-                    "content": [{"type": "text", "text": f"Error executing tool calls: {str(e)}"}]
-                }
-            )
-            set_task_status(conversation_id, "error")
-            return
-        
-        # Check if cancelled
-        if auto_execute_tasks.get(conversation_id) == "cancelled":
-            logger.info(f"Automatic execution of conversation {conversation_id} cancelled")
-            return
-        
-        # Format tool results as expected by Claude API
-        tool_result_blocks = format_tool_results_for_claude(tool_results)
-        
-        # Add tool results to conversation history
-        add_message_to_conversation(
-            conversation_id,
-            {
-                "role": "user",
-                "content": tool_result_blocks
-            }
-        )
-        
         # Prepare thinking parameter
         thinking_param = None
         temperature_param = 0.7
         if thinking_mode:
-            thinking_param = {
-                "type": "enabled",
-                "budget_tokens": thinking_budget_tokens
-            }
+            thinking_param = {**_THINKING_ENABLED, "budget_tokens": thinking_budget_tokens}
             temperature_param = 1.0
         
-        # Check if cancelled
-        if auto_execute_tasks.get(conversation_id) == "cancelled":
-            logger.info(f"Automatic execution of conversation {conversation_id} cancelled")
-            return
+        # Each turn executes the tool calls, sends the results to Claude and picks
+        # up the tool calls of its reply, until there are none left to run
+        while tool_calls:
+            # Check if cancelled
+            if is_cancelled(conversation_id):
+                logger.info("Automatic execution of conversation %s cancelled", conversation_id)
+                return
             
-        # Call Claude API to continue conversation
-        logger.info(f"Continuing conversation with Claude, conversation ID: {conversation_id}")
-        try:
-            response = client.messages.create(
-                model="claude-3-7-sonnet-20250219",
-                system="You are running in a headless environment. When generating code that creates visualizations or outputs:\n"\
-                      "1. DO NOT use interactive elements like plt.show(), figure.show(), or display()\n"\
-                      "2. Instead, save outputs to files (e.g., plt.savefig('output.png'))\n"\
-                      "3. For Python plots, use matplotlib's savefig() method\n"\
-                      "4. For Jupyter-style outputs, write to files instead\n"\
-                      "5. Always provide complete, self-contained code that can run without user interaction\n"\
-                      "6. Assume your code runs in a script context, not an interactive notebook",
-                messages=history,
-                max_tokens=max_tokens,
-                temperature=temperature_param,
-                tools=TOOL_DEFINITIONS,
-                thinking=thinking_param,
-            )
-        except Exception as e:
-            logger.error(f"Error calling Claude API: {str(e)}")
-            # Add error message to history
+            # Automatically execute tool calls and get results
+            try:
+                tool_results = await auto_execute_tool_calls(tool_calls, conversation_id)
+            except Exception as e:
+                logger.error("Error executing tool calls: %s", e)
+                # Add error message to history
+                add_message_to_conversation(
+                    conversation_id,
+                    {
+                        "role": "system",
+                        "content": [{"type": "text", "text": f"Error executing tool calls: {str(e)}"}]
+                    }
+                )
+                set_task_status(conversation_id, "error")
+                return
+            
+            # Check if cancelled
+            if is_cancelled(conversation_id):
+                logger.info("Automatic execution of conversation %s cancelled", conversation_id)
+                return
+            
+            # Format tool results as expected by Claude API
+            tool_result_blocks = format_tool_results_for_claude(tool_results)
+            
+            # Add tool results to conversation history
             add_message_to_conversation(
                 conversation_id,
                 {
-                    "role": "system",
-                    "content": [{"type": "text", "text": f"Error calling Claude API: {str(e)}"}]
+                    "role": "user",
+                    "content": tool_result_blocks
                 }
             )
-            set_task_status(conversation_id, "error")
-            return
-        
-        # Process response
-        try:
-            # Extract response content
-            if hasattr(response, 'model_dump'):
-                response_dict = response.model_dump()
-                raw_content = response_dict.get('content', [])
-            else:
-                raw_content = response.content
+            
+            # Check if cancelled
+            if is_cancelled(conversation_id):
+                logger.info("Automatic execution of conversation %s cancelled", conversation_id)
+                return
                 
-            # Convert content items to dictionaries
-            content = []
-            for item in raw_content:
-                if hasattr(item, 'model_dump'):
-                    content.append(item.model_dump())
-                elif hasattr(item, '__dict__'):
-                    content.append(item.__dict__)
-                else:
-                    content.append(dict(item))
-                    
-            # Add assistant response to conversation history
-            add_message_to_conversation(
-                conversation_id,
-                {"role": "assistant", "content": content}
+            # Call Claude API to continue conversation
+            logger.info("Continuing conversation with Claude, conversation ID: %s", conversation_id)
+            request_params = dict(
+                model="claude-3-7-sonnet-20250219",
+                system=SYSTEM_PROMPT,
+                messages=get_api_messages(conversation_id),
+                max_tokens=max_tokens,
+                temperature=temperature_param,
+                tools=TOOL_DEFINITIONS,
+                thinking=thinking_param,
             )
             
-            # Check if cancelled
-            if auto_execute_tasks.get(conversation_id) == "cancelled":
-                logger.info(f"Automatic execution of conversation {conversation_id} cancelled")
+            # Identical requests (e.g. when replaying a conversation) can be answered
+            # from the response cache, if enabled
+            cache_key = response_cache_key(**{**request_params, "tools": TOOL_DEFINITIONS_HASH})
+            content = get_cached_response(cache_key)
+            try:
+                if content is None:
+                    response = await create_message(client, **request_params)
+                    usage = getattr(response, "usage", None)
+                    if usage is not None and logger.isEnabledFor(logging.DEBUG):
+                        logger.debug(
+                            "Prompt cache for conversation %s: %s input tokens read, %s written",
+                            conversation_id,
+                            getattr(usage, "cache_read_input_tokens", None),
+                            getattr(usage, "cache_creation_input_tokens", None)
+                        )
+            except Exception as e:
+                logger.error("Error calling Claude API: %s", e)
+                # Add error message to history
+                add_message_to_conversation(
+                    conversation_id,
+                    {
+                        "role": "system",
+                        "content": [{"type": "text", "text": f"Error calling Claude API: {str(e)}"}]
+                    }
+                )
+                set_task_status(conversation_id, "error")
                 return
+            
+            # Process response
+            try:
+                if content is None:
+                    # Convert response content to dictionaries
+                    content = response_to_content(response)
+                    cache_response(cache_key, content)
+                        
+                # Add assistant response to conversation history; its tool calls are
+                # extracted once while the message is indexed
+                new_tool_calls = add_message_to_conversation(
+                    conversation_id,
+                    {"role": "assistant", "content": content}
+                )
                 
-            # Extract new tool calls
-            new_tool_calls = []
-            for item in content:
-                if item.get('type') == 'tool_use':
-                    new_tool_calls.append({
-                        "id": item.get('id'),
-                        "name": item.get('name'),
-                        "input": item.get('input', {})
-                    })
+                # Check if cancelled
+                if is_cancelled(conversation_id):
+                    logger.info("Automatic execution of conversation %s cancelled", conversation_id)
+                    return
                     
-            # If there are new tool calls and automatic execution is enabled, recursively process
-            if auto_execute_tools and new_tool_calls:
-                # Increment the counter for this conversation and check for limit
-                current_count = increment_auto_execute_count(conversation_id)
-                logger.info(f"Found {len(new_tool_calls)} new tool calls, auto-execution count: {current_count}")
-                
-                # Check if we've reached the limit (10 calls)
-                if current_count > 10:
-                    logger.info(f"Auto-execution limit reached for conversation {conversation_id}")
+                tool_calls = None
+                        
+                # If there are new tool calls and automatic execution is enabled, run them in the next turn
+                if auto_execute_tools and new_tool_calls:
+                    # Increment the counter for this conversation and check for limit
+                    current_count = increment_auto_execute_count(conversation_id)
+                    logger.info("Found %s new tool calls, auto-execution count: %s", len(new_tool_calls), current_count)
                     
-                    # Add message to conversation to ask user if they want to continue
-                    add_message_to_conversation(
-                        conversation_id,
-                        {
-                            "role": "system",
-                            "content": [{"type": "text", "text": "Automatic tool execution limit (10) reached. Please confirm if you want to continue with automatic execution by clicking the 'Continue' button."}]
-                        }
-                    )
+                    # Check if we've reached the limit (10 calls)
+                    if current_count > 10:
+                        logger.info("Auto-execution limit reached for conversation %s", conversation_id)
+                        
+                        # Add message to conversation to ask user if they want to continue
+                        add_message_to_conversation(
+                            conversation_id,
+                            {
+                                "role": "system",
+                                "content": [{"type": "text", "text": "Automatic tool execution limit (10) reached. Please confirm if you want to continue with automatic execution by clicking the 'Continue' button."}]
+                            }
+                        )
+                        
+                        # Change status to paused
+                        set_task_status(conversation_id, "paused")
+                    else:
+                        # Continue with automatic execution
+                        logger.info("Auto-execution count %s is below limit, continuing processing", current_count)
+                        tool_calls = new_tool_calls
                     
-                    # Change status to paused
-                    set_task_status(conversation_id, "paused")
-                else:
-                    # Continue with automatic execution
-                    logger.info(f"Auto-execution count {current_count} is below limit, continuing processing")
-                    await process_tool_calls_and_continue(
-                        new_tool_calls, 
-                        conversation_id, 
-                        max_tokens, 
-                        thinking_mode, 
-                        thinking_budget_tokens,
-                        auto_execute_tools,
-                        client
-                    )
-                
-        except Exception as e:
-            logger.error(f"Error processing Claude response: {str(e)}")
-            # Add error message to history
-            add_message_to_conversation(
-                conversation_id,
-                {
-                    "role": "system",
-                    "content": [{"type": "text", "text": f"Error processing Claude response: {str(e)}"}]
-                }
-            )
-            set_task_status(conversation_id, "error")
+            except Exception as e:
+                logger.error("Error processing Claude response: %s", e)
+                # Add error message to history
+                add_message_to_conversation(
+                    conversation_id,
+                    {
+                        "role": "system",
+                        "content": [{"type": "text", "text": f"Error processing Claude response: {str(e)}"}]
+                    }
+                )
+                set_task_status(conversation_id, "error")
+                return
+        
+        # The chain ran out of tool calls. A pause keeps its status so it can be
+        # resumed, as does a cancellation that came in after the last check.
+        if get_task_status(conversation_id) not in ("paused", "cancelled"):
+            set_task_status(conversation_id, "completed")
             
     except Exception as e:
-        logger.error(f"Error processing tool calls and continuing conversation: {str(e)}")
+        logger.error("Error processing tool calls and continuing conversation: %s", e)
         # Add error message to conversation history
         if conversation_id in conversations:
             add_message_to_conversation(
@@ -281,7 +296,84 @@ async def process_tool_calls_and_continue(
                 }
             )
         set_task_status(conversation_id, "error")
-    finally:
-        # Clean up state after task completion
-        if conversation_id in auto_execute_tasks and auto_execute_tasks[conversation_id] not in ["cancelled", "error"]:
-            set_task_status(conversation_id, "completed") 
\ No newline at end of file
+
+def start_tool_execution(
+    tool_calls: List[Dict[str, Any]], 
+    conversation_id: str, 
+    max_tokens: int, 
+    thinking_mode: bool, 
+    thinking_budget_tokens: int,
+    auto_execute_tools: bool,
+    client: anthropic.AsyncAnthropic
+) -> Optional[asyncio.Task]:
+    """
+    Start processing tool calls as a task of its own, detached from the request.
+    
+    Must be called from a running event loop. Returns None without starting
+    anything when MAX_ACTIVE_TOOL_TASKS chains are already running, counting
+    every chain of every conversation.
+    
+    Args:
+        tool_calls: List of tool calls to process
+        conversation_id: The conversation ID
+        max_tokens: Maximum tokens for Claude response
+        thinking_mode: Whether to enable thinking mode
+        thinking_budget_tokens: Budget for thinking tokens
+        auto_execute_tools: Whether to automatically execute tool calls
+        client: Anthropic client instance
+        
+    Returns:
+        The started task, or None if too many tasks are running
+    """
+    if sum(len(tasks) for tasks in active_tool_tasks.values()) >= MAX_ACTIVE_TOOL_TASKS:
+        logger.warning("Too many active tool executions, not starting one for conversation %s", conversation_id)
+        return None
+    
+    # A new chain starts from a clean status, so pollers do not stop on the error,
+    # cancellation or completion of an earlier chain
+    set_task_status(conversation_id, "running")
+    
+    task = asyncio.create_task(process_tool_calls_and_continue(
+        tool_calls, 
+        conversation_id, 
+        max_tokens, 
+        thinking_mode, 
+        thinking_budget_tokens,
+        auto_execute_tools,
+        client
+    ))
+    active_tool_tasks.setdefault(conversation_id, {})[task] = asyncio.get_running_loop()
+    
+    def _forget(finished: asyncio.Task) -> None:
+        tasks = active_tool_tasks.get(conversation_id)
+        if tasks is not None:
+            tasks.pop(finished, None)
+            if not tasks:
+                del active_tool_tasks[conversation_id]
+    
+    task.add_done_callback(_forget)
+    return task
+
+def cancel_tool_execution(conversation_id: str) -> bool:
+    """
+    Cancel every running tool execution task of a conversation, if any.
+    
+    Safe to call from worker threads; the cancellation is handed to the
+    loop the task runs on.
+    
+    Args:
+        conversation_id: The conversation ID
+        
+    Returns:
+        True if at least one running task was cancelled
+    """
+    cancelled = False
+    # Copied, as done callbacks may remove tasks meanwhile
+    for task, loop in list(active_tool_tasks.get(conversation_id, {}).items()):
+        try:
+            loop.call_soon_threadsafe(task.cancel)
+        except RuntimeError:
+            # The loop has already been closed
+            continue
+        cancelled = True
+    return cancelled
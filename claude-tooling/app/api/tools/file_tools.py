@@ -1,9 +1,60 @@
 import os
+import stat
 import logging
+import tempfile
+from functools import lru_cache
 from typing import Dict, Any, Optional, Union
 
 logger = logging.getLogger(__name__)
 
+# Files up to this size are kept in the read cache
+READ_CACHE_MAX_FILE_SIZE = 2 * 1024 * 1024
+
+def _read_text(file_path: str) -> str:
+    """Read the whole content of a text file."""
+    with open(file_path, 'r') as f:
+        return f.read()
+
+@lru_cache(maxsize=128)
+def _read_cached(file_path: str, ino: int, size: int, mtime_ns: int, ctime_ns: int) -> str:
+    """
+    Read a text file, cached by path, inode, size and change times.
+    
+    Claude often reads the same file again within a conversation. Replacing
+    the file changes its inode, and writing to it or resetting its
+    modification time changes its ctime, so a stale entry is very unlikely;
+    only a filesystem with coarse timestamps can miss a rewrite that keeps
+    the size.
+    
+    Args:
+        file_path: Absolute path to the file
+        ino: Inode number of the file
+        size: Size of the file in bytes
+        mtime_ns: Modification time of the file in nanoseconds
+        ctime_ns: Status change time of the file in nanoseconds
+        
+    Returns:
+        The file content
+    """
+    return _read_text(file_path)
+
+def _current_umask() -> int:
+    """Read the process umask; os.umask can only read it by setting it."""
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+# Permissions of newly created files, as open() would create them. Temporary
+# files from mkstemp are private (0600), so saved files get these explicitly.
+_NEW_FILE_MODE = 0o666 & ~_current_umask()
+
+def _replacement_mode(file_path: str) -> int:
+    """Get the permissions for a saved file: those of the file it replaces, if any."""
+    try:
+        return stat.S_IMODE(os.stat(file_path).st_mode)
+    except FileNotFoundError:
+        return _NEW_FILE_MODE
+
 def save_file(file_path: str, content: str) -> Dict[str, Any]:
     """
     Save content to a file. Creates directories in the path if they don't exist.
@@ -26,13 +77,27 @@ def save_file(file_path: str, content: str) -> Dict[str, Any]:
             
         # Make sure directory exists
         directory = os.path.dirname(file_path)
-        if directory and not os.path.exists(directory):
+        if directory:
             os.makedirs(directory, exist_ok=True)
-            logger.info(f"Created directory: {directory}")
             
-        # Write the file
-        with open(file_path, 'w') as f:
-            f.write(content)
+        # Write to a uniquely named temporary file next to the target and move it
+        # into place, so readers never see a partially written file and concurrent
+        # saves never share a temporary file. The name is hidden and ends in .tmp,
+        # so file listings skip it.
+        fd, tmp_path = tempfile.mkstemp(
+            dir=directory or ".", prefix=f".{os.path.basename(file_path)}.", suffix=".tmp"
+        )
+        try:
+            with os.fdopen(fd, 'w') as f:
+                f.write(content)
+            os.chmod(tmp_path, _replacement_mode(file_path))
+            os.replace(tmp_path, file_path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
             
         logger.info(f"File saved successfully to {file_path}")
         return {
@@ -68,7 +133,9 @@ def read_file(file_path: str) -> Dict[str, Any]:
             }
             
         # Check if file exists
-        if not os.path.exists(file_path):
+        try:
+            file_stat = os.stat(file_path)
+        except FileNotFoundError:
             error_msg = f"File not found: {file_path}"
             logger.error(error_msg)
             return {
@@ -76,9 +143,14 @@ def read_file(file_path: str) -> Dict[str, Any]:
                 "message": error_msg,
             }
             
-        # Read the file
-        with open(file_path, 'r') as f:
-            content = f.read()
+        # Read the file; small files are served from the cache while unchanged
+        if file_stat.st_size <= READ_CACHE_MAX_FILE_SIZE:
+            content = _read_cached(
+                os.path.abspath(file_path), file_stat.st_ino, file_stat.st_size,
+                file_stat.st_mtime_ns, file_stat.st_ctime_ns
+            )
+        else:
+            content = _read_text(file_path)
             
         logger.info(f"File read successfully from {file_path}")
         return {
@@ -1,9 +1,17 @@
 import json
+import hashlib
 import logging
 import os
 import mimetypes
+import re
 import sys
-from typing import List, Dict, Any, Callable, Optional, Union
+import time
+import threading
+import traceback
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait as wait_futures
+from typing import List, Dict, Any, Callable, Optional, Union, Tuple
+import orjson
 from .file_tools import save_file, read_file
 from .command_tools import run_command, install_python_package
 from .web_tools import search, extract_content
@@ -15,9 +23,35 @@ if app_dir not in sys.path:
 
 logger = logging.getLogger(__name__)
 
+# JSON array in Claude's answer when detecting generated files
+_JSON_ARRAY_RE = re.compile(r'\[.*\]')
+
 # Dictionary to store conversation root directories
 CONVERSATION_ROOT_DIRS = {}
 
+# Tools without side effects; consecutive calls of these in one batch run concurrently
+PARALLEL_SAFE_TOOLS = frozenset({"read_file", "web_search", "extract_web_content"})
+
+# Upper bound on tool calls running concurrently, across all conversations
+MAX_PARALLEL_TOOL_CALLS = 8
+
+# Seconds to wait for each concurrently run tool call before reporting it as failed
+PARALLEL_TOOL_TIMEOUT = 300
+
+_tool_executor = ThreadPoolExecutor(max_workers=MAX_PARALLEL_TOOL_CALLS, thread_name_prefix="tool-call")
+
+# Tools whose successful results are reused for identical calls, across turns and
+# conversations. Web lookups are slow and rarely change within minutes; file
+# reads have their own mtime-keyed cache, and other tools have side effects.
+CACHEABLE_TOOLS = frozenset({"web_search", "extract_web_content"})
+TOOL_RESULT_CACHE_SIZE = 256
+TOOL_RESULT_CACHE_TTL = 600
+
+# Serialized results by tool call key, least recently used first, with their expiry
+_tool_result_cache: "OrderedDict[Tuple[Any, bytes], Tuple[float, str]]" = OrderedDict()
+_tool_result_cache_lock = threading.Lock()
+_tool_result_cache_stats = {"hits": 0, "misses": 0}
+
 def set_conversation_root_dir(conversation_id: str, root_dir: str):
     """
     Set the root directory for a specific conversation.
@@ -41,6 +75,32 @@ def get_conversation_root_dir(conversation_id: str) -> Optional[str]:
     """
     return CONVERSATION_ROOT_DIRS.get(conversation_id)
 
+# Anthropic client - will be set from app.py
+anthropic_client = None
+
+def set_anthropic_client(client) -> None:
+    """Set the Anthropic client used by the tools"""
+    global anthropic_client
+    anthropic_client = client
+    logger.info("Anthropic client set in tool wrapper")
+
+def get_anthropic_client():
+    """
+    Get the Anthropic client used by the tools.
+    
+    Falls back to creating one on first use when the application has not
+    set a client (e.g. when the tools are used on their own), and keeps it
+    for later calls so its connections are reused.
+    
+    Returns:
+        The Anthropic client
+    """
+    global anthropic_client
+    if anthropic_client is None:
+        import anthropic
+        anthropic_client = anthropic.Anthropic(api_key=os.environ.get("ANTHROPIC_API_KEY"))
+    return anthropic_client
+
 # Tool definitions that match the schema expected by Claude API
 TOOL_DEFINITIONS = [
     {
@@ -156,6 +216,12 @@ TOOL_DEFINITIONS = [
     }
 ]
 
+# Digest of the tool schemas, computed once; identifies the tool set in cache keys
+# without encoding the whole list again, and changes whenever a schema does
+TOOL_DEFINITIONS_HASH = hashlib.blake2b(
+    orjson.dumps(TOOL_DEFINITIONS, option=orjson.OPT_SORT_KEYS), digest_size=16
+).hexdigest()
+
 # Custom wrapper for save_file to handle conversation root directory
 def save_file_with_root(file_path: str, content: str, conversation_id: Optional[str] = None) -> Dict[str, Any]:
     """
@@ -241,7 +307,7 @@ def post_process_save_file(result: Dict[str, Any], conversation_id: Optional[str
         Enhanced result containing file rendering information
     """
     try:
-        logger.info(f"Post-processing save_file result: {json.dumps(result)}")
+        logger.info("Post-processing save_file result: %s", result)
         # Ensure result is in dictionary format
         if isinstance(result, str):
             try:
@@ -318,107 +384,279 @@ def post_process_save_file(result: Dict[str, Any], conversation_id: Optional[str
                 else:
                     logger.info(f"No special rendering applied for file type: {content_type}")
                 
-                logger.info(f"Final enhanced result: {json.dumps(result)}")
+                logger.info("Final enhanced result: %s", result)
             else:
                 logger.warning(f"Missing conversation_id or root directory: {conversation_id}")
     except Exception as e:
         logger.error(f"Error post-processing file result: {str(e)}")
-        import traceback
         logger.error(f"Traceback: {traceback.format_exc()}")
         # If error occurs, return the original result
         pass
     
     return result
 
-def process_tool_calls(tool_calls: List[Dict[str, Any]], conversation_id: Optional[str] = None) -> List[Dict[str, Any]]:
+def _get_cached_tool_result(key: Optional[Tuple[Any, bytes]]) -> Optional[str]:
     """
-    Process a list of tool calls and return results.
+    Look up the serialized result of an earlier identical tool call.
     
     Args:
-        tool_calls: List of tool calls to process
-        conversation_id: Optional conversation ID for context
+        key: The key from _tool_call_key, or None for calls that are not cached
         
     Returns:
-        List of tool results
+        The cached result content, or None on a miss
     """
-    tool_results = []
+    if key is None:
+        return None
+    with _tool_result_cache_lock:
+        entry = _tool_result_cache.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            _tool_result_cache.move_to_end(key)
+            _tool_result_cache_stats["hits"] += 1
+            logger.debug(
+                "Tool result cache hit for %s (%d hits, %d misses)",
+                key[0], _tool_result_cache_stats["hits"], _tool_result_cache_stats["misses"]
+            )
+            return entry[1]
+        if entry is not None:
+            del _tool_result_cache[key]
+        _tool_result_cache_stats["misses"] += 1
+    return None
+
+def _cache_tool_result(key: Tuple[Any, bytes], content: str) -> None:
+    """Store the serialized result of a tool call, evicting the least recently used entry when full."""
+    with _tool_result_cache_lock:
+        _tool_result_cache[key] = (time.monotonic() + TOOL_RESULT_CACHE_TTL, content)
+        _tool_result_cache.move_to_end(key)
+        while len(_tool_result_cache) > TOOL_RESULT_CACHE_SIZE:
+            _tool_result_cache.popitem(last=False)
+
+def _handle_save_file(tool_input: Dict[str, Any], conversation_id: Optional[str]) -> Dict[str, Any]:
+    """Save a file in the conversation directory and add its rendering information."""
+    result = save_file_with_root(tool_input["file_path"], tool_input["content"], conversation_id)
+    # Post-process the result to add rendering information
+    if conversation_id:
+        result = post_process_save_file(result, conversation_id)
+    return result
+
+def _handle_read_file(tool_input: Dict[str, Any], conversation_id: Optional[str]) -> Dict[str, Any]:
+    """Read a file from the conversation directory."""
+    content = read_file_with_root(tool_input["file_path"], conversation_id)
+    return {"status": "success", "content": content}
+
+def _handle_run_terminal_command(tool_input: Dict[str, Any], conversation_id: Optional[str]) -> Dict[str, Any]:
+    """Run a command in the conversation directory and look for generated files."""
+    result = run_command_with_root(tool_input.get("command", ""), tool_input.get("cwd"), conversation_id)
+    # Post-process command result to check for generated files
+    if result.get("status") == "success" and conversation_id:
+        result = post_process_command_result(result, conversation_id)
+    return result
+
+def _handle_install_python_package(tool_input: Dict[str, Any], conversation_id: Optional[str]) -> Dict[str, Any]:
+    """Install a Python package with pip."""
+    package_name = tool_input.get("package_name", "")
+    upgrade = tool_input.get("upgrade", False)
+    return run_command(f"pip install {'--upgrade ' if upgrade else ''}{package_name}")
+
+def _handle_web_search(tool_input: Dict[str, Any], conversation_id: Optional[str]) -> Dict[str, Any]:
+    """Search the web."""
+    return search(tool_input.get("query", ""), tool_input.get("max_results", 10), tool_input.get("max_retries", 3))
+
+def _handle_extract_web_content(tool_input: Dict[str, Any], conversation_id: Optional[str]) -> Dict[str, Any]:
+    """Extract the content of web pages."""
+    return extract_content(tool_input.get("urls", []), tool_input.get("max_concurrent", 3))
+
+# Handler per tool name, each taking the tool input and the conversation ID, so
+# dispatching a call is a single lookup
+_TOOL_HANDLERS: Dict[str, Callable[[Dict[str, Any], Optional[str]], Dict[str, Any]]] = {
+    "save_file": _handle_save_file,
+    "read_file": _handle_read_file,
+    "run_terminal_command": _handle_run_terminal_command,
+    "install_python_package": _handle_install_python_package,
+    "web_search": _handle_web_search,
+    "extract_web_content": _handle_extract_web_content,
+}
+
+def process_tool_call(tool_call: Dict[str, Any], conversation_id: Optional[str] = None, index: int = 0) -> Dict[str, Any]:
+    """
+    Process a single tool call and return its result.
     
-    for tool_call in tool_calls:
-        try:
-            tool_name = tool_call.get("name")
-            tool_input = tool_call.get("input", {})
-            tool_id = tool_call.get("id")
-            
-            logger.info(f"Processing tool call: {tool_name} with input: {json.dumps(tool_input)}")
+    Args:
+        tool_call: The tool call to process
+        conversation_id: Optional conversation ID for context
+        index: Position of the call in its batch, used for calls without an ID
+        
+    Returns:
+        The tool result
+    """
+    try:
+        tool_name = tool_call.get("name")
+        tool_input = tool_call.get("input", {})
+        tool_id = tool_call.get("id")
+        
+        logger.info("Processing tool call: %s with input: %s", tool_name, tool_input)
+        
+        # Web lookups repeated within the cache TTL reuse the earlier result
+        cache_key = _tool_call_key(tool_call) if tool_name in CACHEABLE_TOOLS else None
+        cached_content = _get_cached_tool_result(cache_key)
+        if cached_content is not None:
+            return {
+                "tool_use_id": tool_id or f"unknown_{index}",
+                "content": cached_content
+            }
+        
+        handler = _TOOL_HANDLERS.get(tool_name)
+        if handler is None:
+            result = {"status": "error", "message": f"Unknown tool: {tool_name}"}
+        else:
+            result = handler(tool_input, conversation_id)
             
-            # Process file paths with conversation root directory
-            if tool_name == "save_file" and "file_path" in tool_input and conversation_id:
-                result = save_file_with_root(tool_input["file_path"], tool_input["content"], conversation_id)
-                # Post-process the result to add rendering information
-                result = post_process_save_file(result, conversation_id)
-            elif tool_name == "read_file" and "file_path" in tool_input and conversation_id:
-                content = read_file_with_root(tool_input["file_path"], conversation_id)
-                result = {"status": "success", "content": content}
-            elif tool_name == "run_terminal_command":
-                command = tool_input.get("command", "")
-                cwd = tool_input.get("cwd")
-                result = run_command_with_root(command, cwd, conversation_id)
-                
-                # Post-process command result to check for generated files
-                if result.get("status") == "success" and conversation_id:
-                    result = post_process_command_result(result, conversation_id)
-                    
-            elif tool_name == "install_python_package":
-                package_name = tool_input.get("package_name", "")
-                upgrade = tool_input.get("upgrade", False)
-                command = f"pip install {'--upgrade ' if upgrade else ''}{package_name}"
-                result = run_command(command)
-            elif tool_name == "web_search":
-                query = tool_input.get("query", "")
-                max_results = tool_input.get("max_results", 10)
-                max_retries = tool_input.get("max_retries", 3)
-                result = search(query, max_results, max_retries)
-            elif tool_name == "extract_web_content":
-                urls = tool_input.get("urls", [])
-                max_concurrent = tool_input.get("max_concurrent", 3)
-                result = extract_content(urls, max_concurrent)
-            else:
-                result = {"status": "error", "message": f"Unknown tool: {tool_name}"}
-                
-            # Check if we need to add the tool_use_id to the result for tool result association
-            if tool_id:
-                logger.info(f"Tool call complete for ID {tool_id}: {result.get('status', 'unknown')}")
-                tool_results.append({
-                    "tool_use_id": tool_id,
-                    "content": json.dumps(result, ensure_ascii=False)
-                })
-            else:
-                logger.warning(f"Tool call missing ID: {tool_name}")
-                # Still add the result without association
-                tool_results.append({
-                    "tool_use_id": f"unknown_{len(tool_results)}",
-                    "content": json.dumps(result, ensure_ascii=False)
-                })
-                
-        except Exception as e:
-            logger.error(f"Error processing tool call: {str(e)}")
+        content = _dump_tool_result(result)
+        if cache_key is not None and result.get("status") == "success":
+            _cache_tool_result(cache_key, content)
             
-            # Include the error in the tool result
-            error_result = {
-                "status": "error",
-                "message": f"Error processing tool call: {str(e)}"
+        # Check if we need to add the tool_use_id to the result for tool result association
+        if tool_id:
+            logger.info(f"Tool call complete for ID {tool_id}: {result.get('status', 'unknown')}")
+            return {
+                "tool_use_id": tool_id,
+                "content": content
             }
+        
+        logger.warning(f"Tool call missing ID: {tool_name}")
+        # Still add the result without association
+        return {
+            "tool_use_id": f"unknown_{index}",
+            "content": content
+        }
             
-            if "id" in tool_call:
-                tool_results.append({
-                    "tool_use_id": tool_call["id"],
-                    "content": json.dumps(error_result, ensure_ascii=False)
-                })
+    except Exception as e:
+        logger.error(f"Error processing tool call: {str(e)}")
+        return _tool_error_result(tool_call, index, f"Error processing tool call: {str(e)}")
+
+def _dump_tool_result(result: Any) -> str:
+    """
+    Serialize a tool result to the JSON string sent to Claude.
+    
+    Results can hold whole files or web pages, so they are encoded with
+    orjson; values orjson rejects (e.g. integers over 64 bits) fall back to
+    the json module.
+    
+    Args:
+        result: The tool result
+        
+    Returns:
+        The JSON encoded result
+    """
+    try:
+        return orjson.dumps(result, default=str, option=orjson.OPT_NON_STR_KEYS).decode()
+    except TypeError:
+        return json.dumps(result, ensure_ascii=False, default=str)
+
+def _tool_error_result(tool_call: Dict[str, Any], index: int, message: str) -> Dict[str, Any]:
+    """Build the tool result reporting that a tool call failed."""
+    error_result = {
+        "status": "error",
+        "message": message
+    }
+    return {
+        "tool_use_id": tool_call["id"] if "id" in tool_call else f"error_{index}",
+        "content": orjson.dumps(error_result).decode()
+    }
+
+def _tool_call_key(tool_call: Dict[str, Any]) -> Tuple[Any, bytes]:
+    """Identify a tool call by its tool name and canonically encoded input."""
+    return (
+        tool_call.get("name"),
+        orjson.dumps(tool_call.get("input", {}), option=orjson.OPT_SORT_KEYS, default=str)
+    )
+
+def _run_tool_calls_concurrently(
+    tool_calls: List[Tuple[int, Dict[str, Any]]],
+    conversation_id: Optional[str]
+) -> List[Dict[str, Any]]:
+    """
+    Run independent tool calls on the shared tool executor and collect their results in order.
+    
+    Identical calls (same tool and input) only run once; their copies get
+    the same result under their own tool_use_id.
+    
+    Args:
+        tool_calls: The calls to run, with their position in the batch
+        conversation_id: Optional conversation ID for context
+        
+    Returns:
+        The tool results, in the order of tool_calls
+    """
+    keys = [_tool_call_key(tool_call) for _, tool_call in tool_calls]
+    unique_calls = {}
+    for call, key in zip(tool_calls, keys):
+        unique_calls.setdefault(key, call)
+    
+    if len(unique_calls) == 1:
+        index, tool_call = next(iter(unique_calls.values()))
+        unique_results = [process_tool_call(tool_call, conversation_id, index)]
+    else:
+        futures = [
+            _tool_executor.submit(process_tool_call, tool_call, conversation_id, index)
+            for index, tool_call in unique_calls.values()
+        ]
+        # One deadline for the whole group, however many calls are slow
+        _, not_done = wait_futures(futures, timeout=PARALLEL_TOOL_TIMEOUT)
+        unique_results = []
+        for (index, tool_call), future in zip(unique_calls.values(), futures):
+            if future in not_done:
+                # Calls still queued give their executor slot back; calls already
+                # running cannot be interrupted and finish in the background
+                future.cancel()
+                logger.error("Tool call %s timed out after %s seconds", tool_call.get('name'), PARALLEL_TOOL_TIMEOUT)
+                unique_results.append(_tool_error_result(
+                    tool_call, index, f"Tool call timed out after {PARALLEL_TOOL_TIMEOUT} seconds"
+                ))
             else:
-                tool_results.append({
-                    "tool_use_id": f"error_{len(tool_results)}",
-                    "content": json.dumps(error_result, ensure_ascii=False)
-                })
+                unique_results.append(future.result())
+    
+    result_by_key = dict(zip(unique_calls, unique_results))
+    results = []
+    for (index, tool_call), key in zip(tool_calls, keys):
+        result = result_by_key[key]
+        if unique_calls[key][0] != index:
+            logger.info(f"Reusing result of identical {tool_call.get('name')} call for ID {tool_call.get('id')}")
+            result = {**result, "tool_use_id": tool_call.get("id") or f"unknown_{index}"}
+        results.append(result)
+    return results
+
+def process_tool_calls(tool_calls: List[Dict[str, Any]], conversation_id: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    Process a list of tool calls and return results.
+    
+    Consecutive calls of tools in PARALLEL_SAFE_TOOLS run concurrently, so a
+    turn with several searches or reads takes about as long as the slowest
+    one, and duplicates among them run only once. Every other call runs on
+    its own, in order, since later calls in a batch may depend on its effects
+    (e.g. saving a script and then running it).
+    
+    Args:
+        tool_calls: List of tool calls to process
+        conversation_id: Optional conversation ID for context
+        
+    Returns:
+        List of tool results, in the order of tool_calls
+    """
+    tool_results = []
+    pending = []
+    
+    for index, tool_call in enumerate(tool_calls):
+        if tool_call.get("name") in PARALLEL_SAFE_TOOLS:
+            pending.append((index, tool_call))
+            continue
+        
+        if pending:
+            tool_results.extend(_run_tool_calls_concurrently(pending, conversation_id))
+            pending = []
+        tool_results.append(process_tool_call(tool_call, conversation_id, index))
+    
+    if pending:
+        tool_results.extend(_run_tool_calls_concurrently(pending, conversation_id))
     
     return tool_results
 
@@ -453,17 +691,12 @@ def post_process_command_result(result: Dict[str, Any], conversation_id: Optiona
             
         # Use Claude to detect generated files
         try:
-            # Try to import the Anthropic client from app.py
+            # Reuse the application's client, so its connection pool is shared
             try:
-                from api.app import client
-            except (ImportError, AttributeError):
-                # Try to create a new client if import fails
-                try:
-                    import anthropic
-                    client = anthropic.Anthropic(api_key=os.environ.get("ANTHROPIC_API_KEY"))
-                except Exception as e:
-                    logger.error(f"Failed to create Anthropic client: {str(e)}")
-                    return result
+                client = get_anthropic_client()
+            except Exception as e:
+                logger.error(f"Failed to create Anthropic client: {str(e)}")
+                return result
             
             # Prepare the prompt for Claude
             prompt = f"""Given the following command and its output, identify any files that were generated or created. 
@@ -524,11 +757,9 @@ Just return the raw JSON array with no additional text or explanation.
                     claude_content = response.completion
                 
                 # Parse the JSON array - expected to be a list of filenames
-                import json
                 try:
                     # Try to find a JSON array in the response
-                    import re
-                    json_array_match = re.search(r'\[.*\]', claude_content)
+                    json_array_match = _JSON_ARRAY_RE.search(claude_content)
                     if json_array_match:
                         potential_json = json_array_match.group(0)
                         detected_files = json.loads(potential_json)
@@ -685,7 +916,6 @@ def format_tool_results_for_claude(tool_results: List[Dict[str, Any]]) -> List[D
     
     for result in tool_results:
         try:
-            logger.info(f"Formatting tool result: {json.dumps(result)}")
             tool_use_id = result.get("tool_use_id")
             content = result.get("content")
             
@@ -695,13 +925,13 @@ def format_tool_results_for_claude(tool_results: List[Dict[str, Any]]) -> List[D
                     "tool_use_id": tool_use_id,
                     "content": content
                 })
-                logger.info(f"Successfully formatted tool result for tool_use_id: {tool_use_id}")
-                # Add a debug log of the first few characters of content to verify formatting
-                if isinstance(content, str) and len(content) > 0:
+                # Only a preview of the content is logged; the content is already
+                # serialized and can be large, so it is not encoded again for the log
+                if isinstance(content, str):
                     preview = content[:100] + "..." if len(content) > 100 else content
-                    logger.info(f"Tool result content preview: {preview}")
+                    logger.info("Formatted tool result for tool_use_id %s: %s", tool_use_id, preview)
             else:
-                logger.warning(f"Invalid tool result format - missing tool_use_id or content: {result}")
+                logger.warning("Invalid tool result format - missing tool_use_id or content: %s", result)
         except Exception as e:
             logger.error(f"Error formatting tool result: {str(e)}")
     
@@ -324,19 +324,35 @@ async def extract_web_content(urls: List[str], max_concurrent: int = 3) -> Dict[
         }
 
 # Synchronous wrappers for the async functions
+def _run_sync(coro):
+    """
+    Run a coroutine to completion from synchronous code.
+    
+    Tool calls usually run in worker threads, which have no event loop, so
+    the coroutine gets a fresh loop of its own. When called on a thread whose
+    loop is already running, nest_asyncio lets the loop be re-entered.
+    
+    Args:
+        coro: The coroutine to run
+        
+    Returns:
+        The result of the coroutine
+    """
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+    
+    import nest_asyncio
+    
+    # Apply nest_asyncio to allow nested event loops
+    nest_asyncio.apply(loop)
+    return loop.run_until_complete(coro)
+
 def search(query: str, max_results: int = 10, max_retries: int = 3) -> Dict[str, Any]:
     """Synchronous wrapper for web_search"""
     try:
-        # For a function that's called in an async context (like FastAPI)
-        import nest_asyncio
-        
-        # Apply nest_asyncio to allow nested event loops
-        nest_asyncio.apply()
-        
-        # Now we can safely run the coroutine
-        loop = asyncio.get_event_loop()
-        result = loop.run_until_complete(web_search(query, max_results, max_retries))
-        return result
+        return _run_sync(web_search(query, max_results, max_retries))
     except Exception as e:
         error_msg = f"Search failed: {str(e)}"
         logger.error(error_msg)
@@ -348,20 +364,11 @@ def search(query: str, max_results: int = 10, max_retries: int = 3) -> Dict[str,
 def extract_content(urls: List[str], max_concurrent: int = 3) -> Dict[str, Any]:
     """Synchronous wrapper for extract_web_content"""
     try:
-        # For a function that's called in an async context (like FastAPI)
-        import nest_asyncio
-        
-        # Apply nest_asyncio to allow nested event loops
-        nest_asyncio.apply()
-        
-        # Now we can safely run the coroutine
-        loop = asyncio.get_event_loop()
-        result = loop.run_until_complete(extract_web_content(urls, max_concurrent))
-        return result
+        return _run_sync(extract_web_content(urls, max_concurrent))
     except Exception as e:
         error_msg = f"Error extracting web content: {str(e)}"
         logger.error(error_msg)
         return {
             "status": "error",
             "message": error_msg
-        } 
\ No newline at end of file
+        }
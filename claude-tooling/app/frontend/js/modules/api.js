@@ -123,11 +123,29 @@ async function submitToolResult(toolUseId, result, conversationId, autoExecuteTo
 /**
  * Get conversation updates
  * @param {string} conversationId - Conversation ID
+ * @param {number|null} [waitVersion] - Last seen version; if set, the server holds the request until something changes
+ * @param {number|null} [sinceVersion] - Only return messages added after this version
  * @returns {Promise<Object|null>} Updated messages or null if conversation not found
  */
-async function getConversationUpdates(conversationId) {
+async function getConversationUpdates(conversationId, waitVersion = null, sinceVersion = null) {
+  const params = new URLSearchParams();
+  
+  // Long-poll when we know which version we already have
+  if (waitVersion !== null && waitVersion !== undefined) {
+    params.set('wait_version', waitVersion);
+    params.set('timeout', config.LONG_POLL_TIMEOUT);
+  }
+  
+  // Only fetch the messages added after the version we have
+  if (sinceVersion !== null && sinceVersion !== undefined) {
+    params.set('since_version', sinceVersion);
+  }
+  
+  const query = params.toString();
+  const apiEndpoint = `${config.API_URL}/api/conversation/${conversationId}/messages${query ? `?${query}` : ''}`;
+  
   try {
-    const response = await fetch(`${config.API_URL}/api/conversation/${conversationId}/messages`);
+    const response = await fetch(apiEndpoint);
     
     if (!response.ok) {
       if (response.status === 404) {
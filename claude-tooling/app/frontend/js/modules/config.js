@@ -30,6 +30,12 @@ const API_URL = (() => {
  */
 const POLLING_INTERVAL = 5000; // 5 seconds
 
+/**
+ * Long-poll timeout (seconds)
+ * How long the server may hold an update request open waiting for changes
+ */
+const LONG_POLL_TIMEOUT = 25;
+
 /**
  * Default settings
  */
@@ -69,6 +75,12 @@ const ROLES = {
   THINKING: 'thinking'
 };
 
+/**
+ * Conversation statuses after which automatic tool execution has stopped
+ * and polling for updates can end
+ */
+const FINAL_STATUSES = ['completed', 'paused', 'error', 'cancelled'];
+
 /**
  * File preview configuration
  */
@@ -148,10 +160,12 @@ const CSS_CLASSES = {
 export {
   API_URL,
   POLLING_INTERVAL,
+  LONG_POLL_TIMEOUT,
   DEFAULT_SETTINGS,
   TOOL_DISPLAY,
   MESSAGE_TYPES,
   ROLES,
+  FINAL_STATUSES,
   FILE_PREVIEW,
   CSS_CLASSES
 }; 
\ No newline at end of file
@@ -80,15 +80,20 @@ function processAssistantMessage(content) {
   }
 }
 
+// Incremented on every startPollingForUpdates call so that a superseded
+// polling loop with a request still in flight stops instead of rescheduling
+let pollingGeneration = 0;
+
 /**
  * Start polling for updates
- * Used for auto-executing tools
+ * Used for auto-executing tools. Each request long-polls on the last seen
+ * conversation version, so a new request is only issued after a change or timeout.
  */
 function startPollingForUpdates() {
   // Stop any existing polling
-  const existingInterval = state.getPollingInterval();
-  if (existingInterval) {
-    clearInterval(existingInterval);
+  const existingTimer = state.getPollingInterval();
+  if (existingTimer) {
+    clearTimeout(existingTimer);
   }
   
   // Check if auto-execution is enabled
@@ -101,45 +106,75 @@ function startPollingForUpdates() {
   state.setAutoExecutingTools(true);
   ui.setAutoExecutionIndicator(true);
   
-  // Create polling interval
-  const intervalId = setInterval(async () => {
+  const generation = ++pollingGeneration;
+  let lastVersion = null;
+  
+  const stopPolling = () => {
+    state.setPollingInterval(null);
+    ui.setAutoExecutionIndicator(false);
+  };
+  
+  const poll = async () => {
+    // A newer polling loop has taken over
+    if (generation !== pollingGeneration) {
+      return;
+    }
+    
+    // Check if should continue polling
+    if (!state.isAutoExecutingTools() || !state.getConversationId()) {
+      stopPolling();
+      return;
+    }
+    
+    let delay = 0;
     try {
-      // Check if should continue polling
-      if (!state.isAutoExecutingTools() || !state.getConversationId()) {
-        clearInterval(intervalId);
-        state.setPollingInterval(null);
-        ui.setAutoExecutionIndicator(false);
-        return;
-      }
-      
-      // Get updates
-      const updates = await api.getConversationUpdates(state.getConversationId());
+      // Get updates, waiting on the server until something changes
+      const updates = await api.getConversationUpdates(state.getConversationId(), lastVersion, lastVersion);
       
       if (!updates) {
         console.log('No updates received or conversation does not exist');
-        return;
-      }
-      
-      // Process new messages
-      if (updates.messages && updates.messages.length > 0) {
-        updateChatWithNewMessages(updates.messages);
-      }
-      
-      // Check if completed
-      if (updates.completed) {
-        console.log('Conversation completed, stopping polling');
-        clearInterval(intervalId);
-        state.setPollingInterval(null);
-        state.setAutoExecutingTools(false);
-        ui.setAutoExecutionIndicator(false);
+        delay = config.POLLING_INTERVAL;
+      } else {
+        // After the first full response only the messages added since lastVersion are sent
+        const isDelta = lastVersion !== null;
+        lastVersion = updates.version ?? null;
+        
+        // Process new messages
+        if (updates.messages && updates.messages.length > 0) {
+          updateChatWithNewMessages(updates.messages, isDelta);
+        }
+        
+        // Stop once the server reports that automatic execution has ended
+        if (config.FINAL_STATUSES.includes(updates.status)) {
+          console.log(`Conversation ${updates.status}, stopping polling`);
+          state.setAutoExecutingTools(false);
+          stopPolling();
+          return;
+        }
+        
+        // Servers without long-poll support answer immediately
+        if (lastVersion === null) {
+          delay = config.POLLING_INTERVAL;
+        }
       }
     } catch (error) {
       console.error('Error polling for updates:', error);
+      delay = config.POLLING_INTERVAL;
+    }
+    
+    // Schedule the next request unless polling was stopped or superseded meanwhile
+    if (generation !== pollingGeneration) {
+      return;
+    }
+    if (state.isAutoExecutingTools() && state.getConversationId()) {
+      state.setPollingInterval(setTimeout(poll, delay));
+    } else {
+      stopPolling();
     }
-  }, config.POLLING_INTERVAL);
+  };
   
-  // Save polling interval ID
-  state.setPollingInterval(intervalId);
+  // Start the first request right away
+  state.setPollingInterval(setTimeout(poll, 0));
   
   console.log('Started polling for conversation updates');
 }
@@ -179,8 +214,9 @@ function processToolResult(result, toolUseId) {
 /**
  * Update chat with new messages
  * @param {Array} newMessages - Array of new messages
+ * @param {boolean} isDelta - Whether newMessages only holds messages not seen before
  */
-function updateChatWithNewMessages(newMessages) {
+function updateChatWithNewMessages(newMessages, isDelta = false) {
   if (!Array.isArray(newMessages) || newMessages.length === 0) return;
   
   // Debug output
@@ -191,9 +227,9 @@ function updateChatWithNewMessages(newMessages) {
   
   // Find last handled tool call ID
   const lastHandledToolId = state.getLastToolCallId();
-  let foundLastHandled = !lastHandledToolId; // If no last ID, consider it found
+  // If no last ID, or the messages are all new, consider it found
+  let foundLastHandled = isDelta || !lastHandledToolId;
   let hasNewToolCalls = false;
-  let hasToolResults = false;
   
   // Process messages
   for (const message of newMessages) {
@@ -284,7 +320,6 @@ function updateChatWithNewMessages(newMessages) {
           // Process the tool result to check for generated files
           const processedResult = processToolResult(item.content, item.tool_use_id);
           pendingToolResults.set(item.tool_use_id, processedResult);
-          hasToolResults = true;
           
           // Check if this is the result for the current tool use ID
           if (item.tool_use_id === state.getCurrentToolUseId()) {
@@ -302,18 +337,10 @@ function updateChatWithNewMessages(newMessages) {
     ui.addToolResultToChat(result, toolUseId);
   });
   
-  // Update auto-execution indicator and state
+  // New tool calls - keep indicator on. Whether execution has ended is decided
+  // by the polling loop from the conversation status.
   if (hasNewToolCalls) {
-    // New tool calls - keep indicator on
     ui.setAutoExecutionIndicator(true);
-  } else if (hasToolResults && !hasNewToolCalls) {
-    // Tool results received but no new tool calls - likely finished this step
-    // Check if we're actually waiting for any more tools
-    if (!state.getCurrentToolUseId()) {
-      console.log('No active tool executions, turning off auto-execution indicator');
-      state.setAutoExecutingTools(false);
-      ui.setAutoExecutionIndicator(false);
-    }
   }
 }
 
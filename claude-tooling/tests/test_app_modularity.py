@@ -278,6 +278,118 @@ def test_file_management_module_integration():
     assert callable(get_file_path)
     assert callable(get_file_content_type)
     assert callable(list_files)
+    
+    # Common extensions come from the explicit table, others fall back to mimetypes
+    assert get_file_content_type("notes.MD") == "text/markdown"
+    assert get_file_content_type("plot.jpeg") == "image/jpeg"
+    assert get_file_content_type("report.rtf") == "application/rtf"
+    assert get_file_content_type("Makefile") is None
+    assert get_file_content_type("out.d/Makefile") is None
+    assert get_file_content_type(".hidden") is None
+
+def test_response_service_module_integration():
+    """Test that the response service converts both response shapes"""
+    from app.api.services.response_service import response_to_content
+    
+    # Responses exposing a content list are converted block by block
+    content = [{"type": "text", "text": "Hi there!"}]
+    assert response_to_content(MockResponse(content)) == content
+    
+    # Responses without a content list fall back to model_dump()
+    dump_only = MagicMock(spec=["model_dump"])
+    dump_only.model_dump.return_value = {"content": content}
+    assert response_to_content(dump_only) == content
+    
+    # SDK responses are dumped in a single call
+    from anthropic.types import Message
+    message = Message.model_validate({
+        "id": "msg_test", "type": "message", "role": "assistant", "model": "claude-3-7-sonnet-20250219",
+        "content": [{"type": "text", "text": "Hi there!"}, {"type": "tool_use", "id": "tool_1", "name": "read_file", "input": {"file_path": "a.txt"}}],
+        "stop_reason": "tool_use", "stop_sequence": None, "usage": {"input_tokens": 1, "output_tokens": 1}
+    })
+    assert response_to_content(message) == [block.model_dump() for block in message.content]
+
+def test_create_message_supports_async_and_sync_clients():
+    """Test that async clients are awaited and sync clients still work"""
+    import asyncio
+    from unittest.mock import AsyncMock
+    from app.api.services.response_service import create_message
+    
+    async_client = MagicMock()
+    async_client.messages.create = AsyncMock(return_value="async response")
+    assert asyncio.run(create_message(async_client, model="m")) == "async response"
+    async_client.messages.create.assert_awaited_once_with(model="m")
+    
+    sync_client = MagicMock()
+    sync_client.messages.create.return_value = "sync response"
+    assert asyncio.run(create_message(sync_client, model="m")) == "sync response"
+    sync_client.messages.create.assert_called_once_with(model="m")
+    
+    # The SDK's async client is recognized through its wrapped methods
+    import anthropic
+    sdk_client = anthropic.AsyncAnthropic(api_key="test")
+    with patch.object(sdk_client.messages, "_post", AsyncMock(return_value="sdk response")):
+        assert asyncio.run(create_message(sdk_client, model="m", max_tokens=1, messages=[])) == "sdk response"
+
+def test_build_api_messages_adds_cache_breakpoint():
+    """Test that API messages get a cache breakpoint without touching stored history"""
+    from app.api.services.conversation import build_api_messages
+    
+    history = [
+        {"role": "user", "content": [{"type": "text", "text": "Hello!"}]},
+        {"role": "assistant", "content": [{"type": "tool_use", "id": "t1", "name": "read_file", "input": {}}]},
+        {"role": "user", "content": [{"type": "tool_result", "tool_use_id": "t1", "content": "ok"}]}
+    ]
+    
+    api_messages = build_api_messages(history)
+    
+    assert len(api_messages) == 3
+    assert api_messages[-1]["content"][-1]["cache_control"] == {"type": "ephemeral"}
+    assert "cache_control" not in api_messages[0]["content"][-1]
+    # The stored history stays clean
+    assert "cache_control" not in history[-1]["content"][-1]
+
+def test_build_api_messages_drops_system_notes():
+    """Test that server-side system notes are not sent to Claude"""
+    from app.api.services.conversation import build_api_messages
+    
+    history = [
+        {"role": "user", "content": [{"type": "text", "text": "Hello!"}]},
+        {"role": "assistant", "content": [{"type": "tool_use", "id": "t1", "name": "read_file", "input": {}}]},
+        {"role": "system", "content": [{"type": "text", "text": "Automatic tool execution limit (10) reached."}]},
+        {"role": "system", "content": [{"type": "text", "text": "Automatic tool execution resumed by user"}]},
+        {"role": "user", "content": [{"type": "tool_result", "tool_use_id": "t1", "content": "ok"}]}
+    ]
+    
+    api_messages = build_api_messages(history)
+    
+    assert [message["role"] for message in api_messages] == ["user", "assistant", "user"]
+    assert api_messages[-1]["content"][-1]["tool_use_id"] == "t1"
+    assert len(history) == 5
+
+def test_get_api_messages_follows_added_messages():
+    """Test that the API message mirror matches a full rebuild as messages are added"""
+    from app.api.services.conversation import (
+        build_api_messages, get_api_messages, add_message_to_conversation, conversation_states
+    )
+    
+    conversation_id = f"test_api_mirror_{uuid.uuid4()}"
+    try:
+        add_message_to_conversation(conversation_id, {"role": "user", "content": [{"type": "text", "text": "Hi"}]})
+        add_message_to_conversation(conversation_id, {"role": "system", "content": [{"type": "text", "text": "Note"}]})
+        add_message_to_conversation(conversation_id, {"role": "assistant", "content": [{"type": "text", "text": "Hello"}]})
+        
+        history = conversations[conversation_id]
+        assert get_api_messages(conversation_id) == build_api_messages(history)
+        assert [message["role"] for message in get_api_messages(conversation_id)] == ["user", "assistant"]
+        
+        # Replacing the history rebuilds the mirror
+        conversations[conversation_id] = history[:1]
+        assert get_api_messages(conversation_id) == build_api_messages(history[:1])
+        assert get_api_messages("unknown_conversation") == []
+    finally:
+        conversations.pop(conversation_id, None)
+        conversation_states.pop(conversation_id, None)
 
 if __name__ == "__main__":
     pytest.main(["-v", __file__]) 
\ No newline at end of file
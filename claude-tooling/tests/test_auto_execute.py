@@ -27,7 +27,7 @@ if parent_dir not in sys.path:
 
 # Import the functions to test
 from app.api.services.tool_execution import auto_execute_tool_calls, process_tool_calls_and_continue
-from app.api.services.conversation import conversations, auto_execute_tasks, auto_execute_counts, get_auto_execute_count, increment_auto_execute_count, reset_auto_execute_count
+from app.api.services.conversation import conversations, auto_execute_tasks, auto_execute_counts, get_auto_execute_count, increment_auto_execute_count, reset_auto_execute_count, set_task_status
 from app.api.routes.chat import client
 
 # Sample tool call for testing
@@ -193,6 +193,31 @@ async def test_process_tool_calls_and_continue(mock_process_tool_calls, mock_ant
     # Verify that the mock Anthropic client was called
     mock_anthropic_client.messages.create.assert_called_once()
 
+@pytest.mark.asyncio
+async def test_identical_requests_use_response_cache(mock_process_tool_calls, mock_anthropic_client):
+    """Test that an identical request is answered from the response cache when enabled"""
+    from app.api.services import response_service
+
+    conversation_ids = [f"test_{uuid.uuid4()}" for _ in range(2)]
+    for conversation_id in conversation_ids:
+        conversations[conversation_id] = [
+            {"role": "user", "content": [{"type": "text", "text": "Test message"}]},
+            {"role": "assistant", "content": [
+                {"type": "tool_use", "id": "tool_call_12345", "name": "python_interpreter", "input": {"code": "print('Hello')"}}
+            ]}
+        ]
+
+    with patch.object(response_service, 'RESPONSE_CACHE_SIZE', 4), \
+         patch.object(response_service, '_response_cache', response_service.OrderedDict()):
+        for conversation_id in conversation_ids:
+            await process_tool_calls_and_continue(
+                [SAMPLE_TOOL_CALL], conversation_id, 1000, False, 2000, False, mock_anthropic_client
+            )
+
+    mock_anthropic_client.messages.create.assert_called_once()
+    assert conversations[conversation_ids[1]][-1] == conversations[conversation_ids[0]][-1]
+    assert auto_execute_tasks[conversation_ids[1]] == "completed"
+
 @pytest.mark.asyncio
 async def test_process_tool_calls_and_continue_with_cancellation():
     """Test cancelling the process_tool_calls_and_continue function"""
@@ -200,7 +225,7 @@ async def test_process_tool_calls_and_continue_with_cancellation():
     tool_calls = [SAMPLE_TOOL_CALL]
     conversation_id = f"test_{uuid.uuid4()}"
     conversations[conversation_id] = []
-    auto_execute_tasks[conversation_id] = "cancelled"  # Pre-set to cancelled
+    set_task_status(conversation_id, "cancelled")  # Pre-set to cancelled
     
     # Call the function
     await process_tool_calls_and_continue(
@@ -253,7 +278,7 @@ async def test_process_tool_calls_and_continue_with_error(mock_process_tool_call
 
 @pytest.mark.asyncio
 async def test_recursive_tool_calls():
-    """Test recursive tool calls in process_tool_calls_and_continue"""
+    """Test that new tool calls are processed in further turns of process_tool_calls_and_continue"""
     # Create test data
     conversation_id = f"test_{uuid.uuid4()}"
     conversations[conversation_id] = []
@@ -273,37 +298,37 @@ async def test_recursive_tool_calls():
         ]
         tool_execution_module.process_tool_calls = mock_process
         
-        # Mock Anthropic client to return a response with another tool call
+        # Mock Anthropic client to return a response with another tool call, then a final answer
         with patch('app.api.routes.chat.client') as mock_client:
-            # First create a mock response that has a new tool call
-            mock_response = MagicMock()
-            mock_response.content = [
+            tool_call_response = MagicMock()
+            tool_call_response.content = [
                 {"type": "text", "text": "Here's what I found"},
                 {"type": "tool_use", "id": "tool_call_67890", "name": "python_interpreter", "input": {"code": "print('Another call')"}}
             ]
-            mock_response.model_dump = MagicMock(return_value={"content": mock_response.content})
+            final_response = MagicMock()
+            final_response.content = [{"type": "text", "text": "All done"}]
             
-            # Then have the client return it
-            mock_client.messages.create = MagicMock(return_value=mock_response)
+            mock_client.messages.create = MagicMock(side_effect=[tool_call_response, final_response])
             
-            # Patch the recursive call to track it
-            with patch('app.api.services.tool_execution.process_tool_calls_and_continue', AsyncMock()) as mock_recursive:
-                # Call the function
-                await process_tool_calls_and_continue(
-                    tool_calls,
-                    conversation_id,
-                    1000,  # max_tokens
-                    False,  # thinking_mode
-                    2000,   # thinking_budget_tokens
-                    True,    # auto_execute_tools - enable recursion
-                    mock_client  # Pass the client explicitly
-                )
-                
-                # Verify that the recursive function was called with the new tool calls
-                mock_recursive.assert_called_once()
-                args, kwargs = mock_recursive.call_args
-                assert len(args[0]) == 1  # First arg should be the new tool calls
-                assert args[0][0]["id"] == "tool_call_67890"  # Should have the new tool call
+            # Call the function
+            await process_tool_calls_and_continue(
+                tool_calls,
+                conversation_id,
+                1000,  # max_tokens
+                False,  # thinking_mode
+                2000,   # thinking_budget_tokens
+                True,    # auto_execute_tools - keep processing new tool calls
+                mock_client  # Pass the client explicitly
+            )
+            
+            # Verify that the new tool calls were executed in a second turn
+            assert mock_process.call_count == 2
+            second_tool_calls = mock_process.call_args_list[1][0][0]
+            assert len(second_tool_calls) == 1
+            assert second_tool_calls[0]["id"] == "tool_call_67890"
+            assert mock_client.messages.create.call_count == 2
+            assert conversations[conversation_id][-1]["content"] == [{"type": "text", "text": "All done"}]
+            assert auto_execute_tasks[conversation_id] == "completed"
     finally:
         # Restore the original function
         tool_execution_module.process_tool_calls = original_func
@@ -362,6 +387,29 @@ async def test_process_tool_calls_with_limit():
     assert get_auto_execute_count(conversation_id) == 0
     assert get_auto_execute_count(conversation_id2) == 1
 
+@pytest.mark.asyncio
+async def test_reaching_limit_leaves_execution_paused(mock_process_tool_calls):
+    """Test that the tool loop stays paused when it reaches the auto-execution limit"""
+    conversation_id = f"test_{uuid.uuid4()}"
+    conversations[conversation_id] = []
+    for _ in range(10):
+        increment_auto_execute_count(conversation_id)
+
+    tool_call_response = MagicMock()
+    tool_call_response.content = [
+        {"type": "tool_use", "id": "tool_call_67890", "name": "python_interpreter", "input": {"code": "print('Another call')"}}
+    ]
+    mock_client = MagicMock()
+    mock_client.messages.create.return_value = tool_call_response
+
+    await process_tool_calls_and_continue(
+        [SAMPLE_TOOL_CALL], conversation_id, 1000, False, 2000, True, mock_client
+    )
+
+    assert mock_process_tool_calls.call_count == 1
+    assert auto_execute_tasks[conversation_id] == "paused"
+    assert "limit (10) reached" in conversations[conversation_id][-1]["content"][0]["text"]
+
 @pytest.mark.asyncio
 async def test_resume_after_limit(mock_anthropic_client):
     """Test resuming execution after hitting the limit"""
@@ -386,45 +434,101 @@ async def test_resume_after_limit(mock_anthropic_client):
     from app.api.routes.conversation import resume_auto_execution
     
     # Test resume functionality
-    from fastapi import BackgroundTasks
-    background_tasks = BackgroundTasks()
-    
-    # Patch the background_tasks.add_task to avoid actually calling it
-    with patch.object(background_tasks, 'add_task') as mock_add_task:
-        # Call resume function
-        from fastapi import HTTPException
-        # The module is being imported inside the function, so it's not a top-level attribute
-        # Just skip patching it directly and let the test run
-        with patch('app.api.routes.conversation.process_tool_calls_and_continue') as mock_process:
-            # Mock the client in conversation router
-            from app.api.routes.conversation import client
-            old_client = client
-            from app.api.routes.conversation import set_anthropic_client
-            set_anthropic_client(mock_anthropic_client)
-                
-            try:
-                result = await resume_auto_execution(
-                    conversation_id=conversation_id,
-                    background_tasks=background_tasks
-                )
-                
-                # Check counter was reset
-                assert get_auto_execute_count(conversation_id) == 0
-                
-                # Check status was updated
-                assert auto_execute_tasks[conversation_id] == "running"
-                
-                # Check background task was called
-                mock_add_task.assert_called_once()
-                
-                # Check success message
-                assert result["status"] == "success"
-                
-            except HTTPException as e:
-                pytest.fail(f"resume_auto_execution raised HTTPException: {str(e)}")
+    from fastapi import HTTPException
+    
+    # Patch start_tool_execution to avoid actually running the tool calls
+    with patch('app.api.routes.conversation.start_tool_execution') as mock_start:
+        # Mock the client in conversation router
+        from app.api.routes.conversation import client
+        old_client = client
+        from app.api.routes.conversation import set_anthropic_client
+        set_anthropic_client(mock_anthropic_client)
             
-            # Restore the original client
-            set_anthropic_client(old_client)
+        try:
+            result = await resume_auto_execution(conversation_id=conversation_id)
+            
+            # Check counter was reset
+            assert get_auto_execute_count(conversation_id) == 0
+            
+            # Check status was updated
+            assert auto_execute_tasks[conversation_id] == "running"
+            
+            # Check the tool execution task was started
+            mock_start.assert_called_once()
+            assert mock_start.call_args[0][0][0]["id"] == "tool_call_67890"
+            
+            # Check success message
+            assert result["status"] == "success"
+            
+        except HTTPException as e:
+            pytest.fail(f"resume_auto_execution raised HTTPException: {str(e)}")
+        
+        # Restore the original client
+        set_anthropic_client(old_client)
+
+@pytest.mark.asyncio
+async def test_start_tool_execution_is_bounded_and_cancellable():
+    """Test that tool execution tasks are capped and can be cancelled"""
+    from app.api.services import tool_execution as tool_execution_module
+    
+    conversation_id = f"test_{uuid.uuid4()}"
+    started = asyncio.Event()
+    
+    async def slow_process(*args):
+        started.set()
+        await asyncio.sleep(60)
+    
+    with patch.object(tool_execution_module, 'process_tool_calls_and_continue', slow_process):
+        task = tool_execution_module.start_tool_execution(
+            [SAMPLE_TOOL_CALL], conversation_id, 1000, False, 2000, True, None
+        )
+        await started.wait()
+        assert task in tool_execution_module.active_tool_tasks[conversation_id]
+        
+        with patch.object(tool_execution_module, 'MAX_ACTIVE_TOOL_TASKS', 1):
+            assert tool_execution_module.start_tool_execution(
+                [SAMPLE_TOOL_CALL], f"test_{uuid.uuid4()}", 1000, False, 2000, True, None
+            ) is None
+        
+        assert tool_execution_module.cancel_tool_execution(conversation_id)
+        with pytest.raises(asyncio.CancelledError):
+            await task
+    
+    assert conversation_id not in tool_execution_module.active_tool_tasks
+
+@pytest.mark.asyncio
+async def test_start_tool_execution_tracks_every_chain_of_a_conversation():
+    """Test that a second chain for a conversation is counted and cancelled with the first"""
+    from app.api.services import tool_execution as tool_execution_module
+    
+    conversation_id = f"test_{uuid.uuid4()}"
+    
+    async def slow_process(*args):
+        await asyncio.sleep(60)
+    
+    with patch.object(tool_execution_module, 'process_tool_calls_and_continue', slow_process):
+        first = tool_execution_module.start_tool_execution(
+            [SAMPLE_TOOL_CALL], conversation_id, 1000, False, 2000, True, None
+        )
+        second = tool_execution_module.start_tool_execution(
+            [SAMPLE_TOOL_CALL], conversation_id, 1000, False, 2000, True, None
+        )
+        assert set(tool_execution_module.active_tool_tasks[conversation_id]) == {first, second}
+        
+        # Both chains count against the cap
+        with patch.object(tool_execution_module, 'MAX_ACTIVE_TOOL_TASKS', 2):
+            assert tool_execution_module.start_tool_execution(
+                [SAMPLE_TOOL_CALL], f"test_{uuid.uuid4()}", 1000, False, 2000, True, None
+            ) is None
+        
+        assert tool_execution_module.cancel_tool_execution(conversation_id)
+        for task in (first, second):
+            with pytest.raises(asyncio.CancelledError):
+                await task
+        # Let the done callbacks run
+        await asyncio.sleep(0)
+    
+    assert conversation_id not in tool_execution_module.active_tool_tasks
 
 if __name__ == "__main__":
     pytest.main(["-v", __file__]) 
\ No newline at end of file
@@ -10,6 +10,7 @@ import json
 import logging
 from typing import Dict, Any
 import asyncio
+from collections import OrderedDict
 from unittest.mock import patch
 
 # Set up logging
@@ -69,6 +70,61 @@ def test_read_file():
     
     return result
 
+def test_read_file_cache_follows_changes():
+    """Test that repeated reads are cached until the file changes."""
+    from app.api.tools.file_tools import _read_cached
+
+    test_file = "test_output/cached_read.txt"
+    save_file(test_file, "first version")
+    _read_cached.cache_clear()
+
+    assert read_file(test_file)["content"] == "first version"
+    assert read_file(test_file)["content"] == "first version"
+    assert _read_cached.cache_info().hits == 1
+
+    save_file(test_file, "second, longer version")
+    assert read_file(test_file)["content"] == "second, longer version"
+
+    # Rewrites that keep the size are picked up, whether the file is replaced
+    save_file(test_file, "second, better version")
+    assert read_file(test_file)["content"] == "second, better version"
+
+    # or written in place with its modification time restored
+    mtime_ns = os.stat(test_file).st_mtime_ns
+    with open(test_file, "w") as f:
+        f.write("second, bigger version")
+    os.utime(test_file, ns=(mtime_ns, mtime_ns))
+    assert read_file(test_file)["content"] == "second, bigger version"
+
+    os.remove(test_file)
+    assert read_file(test_file)["status"] == "error"
+
+def test_save_file_replaces_existing_file():
+    """Test that overwriting a file keeps its permissions and leaves no temporary file."""
+    from concurrent.futures import ThreadPoolExecutor
+    from app.api.tools.file_tools import _NEW_FILE_MODE
+
+    test_file = "test_output/nested/replaced.sh"
+    if os.path.exists(test_file):
+        os.remove(test_file)
+    # A user file that happens to be named like a temporary file is left alone
+    save_file(test_file + ".tmp", "keep me")
+    assert save_file(test_file, "echo first")["status"] == "success"
+    assert os.stat(test_file).st_mode & 0o777 == _NEW_FILE_MODE
+    os.chmod(test_file, 0o755)
+
+    assert save_file(test_file, "echo second")["status"] == "success"
+    assert read_file(test_file)["content"] == "echo second"
+    assert os.stat(test_file).st_mode & 0o777 == 0o755
+    assert read_file(test_file + ".tmp")["content"] == "keep me"
+
+    # Concurrent saves each write a whole version of the file
+    versions = [f"version {i} " * 1000 for i in range(8)]
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        assert all(r["status"] == "success" for r in executor.map(lambda c: save_file(test_file, c), versions))
+    assert read_file(test_file)["content"] in versions
+    assert sorted(os.listdir("test_output/nested")) == ["replaced.sh", "replaced.sh.tmp"]
+
 def test_run_command():
     """Test the run_command function."""
     logger.info("Testing run_command function...")
@@ -115,6 +171,21 @@ def test_tool_wrapper():
         "claude_format": claude_format
     }
 
+def test_process_tool_calls_dispatches_by_tool_name():
+    """Test that file tools work without a conversation and unknown tools are reported."""
+    tool_calls = [
+        {"id": "save", "name": "save_file", "input": {"file_path": "test_output/dispatch.txt", "content": "dispatched"}},
+        {"id": "missing", "name": "save_file", "input": {"content": "no path"}},
+        {"id": "unknown", "name": "no_such_tool", "input": {}},
+    ]
+
+    tool_results = process_tool_calls(tool_calls)
+
+    assert json.loads(tool_results[0]["content"])["status"] == "success"
+    assert read_file("test_output/dispatch.txt")["content"] == "dispatched"
+    assert json.loads(tool_results[1]["content"])["status"] == "error"
+    assert json.loads(tool_results[2]["content"])["message"] == "Unknown tool: no_such_tool"
+
 def test_web_search():
     """Test the web search functionality with a mocked response."""
     logger.info("Testing web search function...")
@@ -191,6 +262,103 @@ def test_extract_content():
             "message": f"Exception: {str(e)}"
         }
 
+def test_tool_results_are_serialized_as_json():
+    """Test that tool results keep non-ASCII text and unusual values when serialized."""
+    from app.api.tools.tool_wrapper import _dump_tool_result
+
+    result = {"status": "success", "content": "héllo 世界", 1: 2 ** 70}
+    assert json.loads(_dump_tool_result(result)) == {"status": "success", "content": "héllo 世界", "1": 2 ** 70}
+    assert "世界" in _dump_tool_result({"content": "世界"})
+
+def test_process_tool_calls_runs_independent_calls_concurrently():
+    """Test that consecutive searches run concurrently while results keep their order."""
+    import time
+
+    def slow_search(query, max_results=10, max_retries=3):
+        time.sleep(0.3)
+        return {"status": "success", "query": query}
+
+    tool_calls = [
+        {"id": f"search_{i}", "name": "web_search", "input": {"query": f"query {i}"}}
+        for i in range(4)
+    ]
+    tool_calls.append({"id": "unknown_tool", "name": "no_such_tool", "input": {}})
+
+    with patch('app.api.tools.tool_wrapper.search', side_effect=slow_search), \
+         patch('app.api.tools.tool_wrapper._tool_result_cache', OrderedDict()):
+        start = time.monotonic()
+        tool_results = process_tool_calls(tool_calls)
+        elapsed = time.monotonic() - start
+
+    assert elapsed < 1.0
+    assert [result["tool_use_id"] for result in tool_results] == [tool_call["id"] for tool_call in tool_calls]
+    assert json.loads(tool_results[2]["content"])["query"] == "query 2"
+    assert json.loads(tool_results[4]["content"])["status"] == "error"
+
+def test_concurrent_tool_calls_share_one_timeout():
+    """Test that slow concurrent calls time out together rather than one after another."""
+    import time
+    from app.api.tools import tool_wrapper
+
+    def slow_search(query, max_results=10, max_retries=3):
+        time.sleep(0.5)
+        return {"status": "success", "query": query}
+
+    tool_calls = [
+        {"id": f"search_{i}", "name": "web_search", "input": {"query": f"slow {i}"}}
+        for i in range(3)
+    ]
+
+    with patch('app.api.tools.tool_wrapper.search', side_effect=slow_search), \
+         patch('app.api.tools.tool_wrapper._tool_result_cache', OrderedDict()), \
+         patch.object(tool_wrapper, 'PARALLEL_TOOL_TIMEOUT', 0.2):
+        start = time.monotonic()
+        tool_results = process_tool_calls(tool_calls)
+        elapsed = time.monotonic() - start
+        # Let the abandoned calls finish before the patches are undone
+        time.sleep(0.5)
+
+    assert elapsed < 0.45
+    assert [result["tool_use_id"] for result in tool_results] == ["search_0", "search_1", "search_2"]
+    assert all("timed out" in json.loads(result["content"])["message"] for result in tool_results)
+
+def test_process_tool_calls_runs_duplicate_reads_once():
+    """Test that identical read-only calls in a batch share a single execution."""
+    tool_calls = [
+        {"id": "search_a", "name": "web_search", "input": {"query": "same", "max_results": 3}},
+        {"id": "search_b", "name": "web_search", "input": {"max_results": 3, "query": "same"}},
+        {"id": "search_c", "name": "web_search", "input": {"query": "other"}},
+    ]
+
+    with patch('app.api.tools.tool_wrapper.search', return_value={"status": "success"}) as mock_search, \
+         patch('app.api.tools.tool_wrapper._tool_result_cache', OrderedDict()):
+        tool_results = process_tool_calls(tool_calls)
+
+    assert mock_search.call_count == 2
+    assert [result["tool_use_id"] for result in tool_results] == ["search_a", "search_b", "search_c"]
+    assert tool_results[0]["content"] == tool_results[1]["content"]
+
+def test_web_tool_results_are_cached_across_batches():
+    """Test that a repeated successful search reuses the earlier result until it expires."""
+    from app.api.tools import tool_wrapper
+
+    tool_call = {"id": "search_1", "name": "web_search", "input": {"query": "cached query"}}
+
+    with patch('app.api.tools.tool_wrapper.search', return_value={"status": "success", "results": []}) as mock_search, \
+         patch('app.api.tools.tool_wrapper._tool_result_cache', OrderedDict()):
+        first = process_tool_calls([tool_call])
+        second = process_tool_calls([{**tool_call, "id": "search_2"}])
+        assert mock_search.call_count == 1
+        assert second[0]["tool_use_id"] == "search_2"
+        assert second[0]["content"] == first[0]["content"]
+
+        # Expired entries are fetched again
+        tool_wrapper._tool_result_cache.clear()
+        with patch.object(tool_wrapper, 'TOOL_RESULT_CACHE_TTL', -1):
+            process_tool_calls([tool_call])
+            process_tool_calls([tool_call])
+        assert mock_search.call_count == 3
+
 def run_all_tests():
     """Run all tests and report results."""
     logger.info("Starting tool module tests...")